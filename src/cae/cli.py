@@ -2,8 +2,22 @@ import argparse
 import csv
 import datetime
 import os
+
+import h5py
+import numpy as np
+import torch
+from model.chart_auto_encoder import ChartAutoEncoder
+from model.reimagining_price_trends import RIPTModel
+from utils.backtest import backtest, load_panel, load_predictions
 from utils.download_data import download_data
+from utils.embeddings import export_embeddings, load_embeddings
 from utils.images import create_dataset, ImageType
+from utils.live_scoring import LiveImageEngine, read_bars, warm_up_from_source
+from utils.nearest_neighbours import build_index, load_index, INDEX_TYPES
+from utils.repack import COMPRESSIONS, ORDERS, repack
+from utils.scoring_server import model_predictor, serve
+from utils.shards import create_sharded_dataset, stitch_shards
+from utils.sweep import grid, run_sweep
 
 
 def run_model(args):
@@ -41,11 +55,29 @@ def _create_dataset(args):
         for file in os.listdir(args.source)
         if file.endswith(".csv")
     ]
-    create_dataset(
-        args.dataset_name,
-        csv_files=csv_files,
-        image_type=args.image_type,
-    )
+    if args.shards is None:
+        if args.shard_index is not None or args.processes is not None:
+            raise ValueError("--shard-index and --processes require --shards")
+        create_dataset(
+            args.dataset_name,
+            csv_files=csv_files,
+            image_type=args.image_type,
+            resume=args.resume,
+        )
+    else:
+        create_sharded_dataset(
+            args.dataset_name,
+            csv_files=csv_files,
+            image_type=args.image_type,
+            n_shards=args.shards,
+            shard_indices=args.shard_index,
+            processes=args.processes,
+            resume=args.resume,
+        )
+
+
+def _stitch_shards(args):
+    stitch_shards(args.dataset_name, args.shards)
 
 
 def _download_data(args):
@@ -57,6 +89,139 @@ def _download_data(args):
     )
 
 
+def _export_embeddings(args):
+    model = ChartAutoEncoder(
+        (3, args.image_type.pixel_height, 3 * args.image_type.candles),
+        embedding_size=args.embedding_size,
+    )
+    model.load_state_dict(torch.load(args.weights, map_location="cpu"))
+    export_embeddings(
+        model,
+        args.dataset,
+        args.output,
+        batch_size=args.batch_size,
+        device=args.device,
+    )
+
+
+def _build_index(args):
+    kwargs = (
+        {}
+        if args.index_type == "brute_force"
+        else {
+            "n_lists": args.n_lists,
+            "n_subquantizers": args.n_subquantizers,
+            "n_probe": args.n_probe,
+        }
+    )
+    index = build_index(load_embeddings(args.embeddings), args.index_type, **kwargs)
+    index.save(args.output)
+
+
+def _find_similar(args):
+    index = load_index(args.index)
+    with h5py.File(args.embeddings, "r") as embeddings_file:
+        query = embeddings_file["embeddings"][args.row]
+        distances, indices = index.search(query, k=args.k)
+        for distance, idx in zip(distances[0], indices[0]):
+            if idx < 0:
+                continue
+            ticker = embeddings_file["ticker"][idx].decode()
+            date = embeddings_file["date"][idx].decode()
+            print(f"{idx}\t{ticker}\t{date}\t{distance:.4f}")
+
+
+def _serve(args):
+    model = RIPTModel((3, args.image_type.pixel_height, 3 * args.image_type.candles))
+    model.load_state_dict(torch.load(args.weights, map_location="cpu"))
+    serve(
+        model,
+        args.image_type,
+        host=args.host,
+        port=args.port,
+        source=args.source,
+        max_batch_size=args.max_batch_size,
+        max_wait=args.max_wait_ms / 1000,
+        device=args.device,
+    )
+
+
+def _backtest(args):
+    panel = load_panel(args.dataset, load_predictions(args.predictions))
+    for horizon in args.horizons:
+        result = backtest(
+            panel, horizon, n_deciles=args.deciles, weighting=args.weighting
+        )
+        print(f"Horizon {horizon} days, {len(result.dates)} rebalances")
+        for decile, (returns, sharpe) in enumerate(
+            zip(result.decile_returns.T, result.decile_sharpes)
+        ):
+            print(
+                f"  Decile {decile + 1}: mean return {np.nanmean(returns):.4%}, "
+                f"sharpe {sharpe:.2f}"
+            )
+        print(
+            f"  Long-short: mean return {np.nanmean(result.long_short_returns):.4%}, "
+            f"sharpe {result.long_short_sharpe:.2f}, "
+            f"turnover {result.mean_turnover:.2%}"
+        )
+
+
+def _score_live(args):
+    if os.path.exists(args.state):
+        engine = LiveImageEngine.load(args.state)
+    else:
+        engine = LiveImageEngine(args.image_type)
+    bars = read_bars(args.bars)
+    if args.source is not None:
+        warm_up_from_source(engine, bars, args.source)
+
+    model = RIPTModel(
+        (3, engine.image_type.pixel_height, 3 * engine.image_type.candles)
+    )
+    model.load_state_dict(torch.load(args.weights, map_location="cpu"))
+    scores = engine.score(bars, model_predictor(model))
+
+    with open(args.output, "w") as output_file:
+        writer = csv.DictWriter(output_file, ["ticker", "date", "probability"])
+        writer.writeheader()
+        for ticker, probability in scores.items():
+            writer.writerow(
+                {
+                    "ticker": ticker,
+                    "date": bars[ticker].get("Date", bars[ticker].get("date")),
+                    "probability": probability,
+                }
+            )
+    engine.save(args.state)
+
+
+def _repack(args):
+    digests = repack(
+        args.source,
+        args.output,
+        order=args.order,
+        chunk_rows=args.chunk_rows,
+        compression=args.compression,
+        compression_level=args.compression_level,
+        image_dtype=args.image_dtype,
+        block_rows=args.block_rows,
+    )
+    for field, digest in digests.items():
+        print(f"{field}\tdigest {digest}")
+
+
+def _sweep(args):
+    run_sweep(
+        grid(args.dataset, args.learning_rates, args.dropouts, args.horizons),
+        args.output,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        max_concurrent=args.max_concurrent,
+        grace_epochs=args.grace_epochs,
+    )
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Utility for managing datasets and models"
@@ -83,8 +248,36 @@ def main():
         required=True,
         help="image type option",
     )
+    parser_dataset.add_argument(
+        "--resume",
+        action="store_true",
+        help="keep tickers already committed to an existing dataset file",
+    )
+    parser_dataset.add_argument(
+        "--shards", type=int, help="split the dataset into this many shard files"
+    )
+    parser_dataset.add_argument(
+        "--shard-index",
+        type=int,
+        action="append",
+        help="only build this shard, can be repeated (requires --shards)",
+    )
+    parser_dataset.add_argument(
+        "--processes", type=int, help="number of shards to build in parallel"
+    )
     parser_dataset.set_defaults(func=_create_dataset)
 
+    parser_stitch = subparsers.add_parser(
+        "stitch_shards", help="combine dataset shards into a single virtual dataset"
+    )
+    parser_stitch.add_argument(
+        "--dataset-name", required=True, help="name the shards were created under"
+    )
+    parser_stitch.add_argument(
+        "--shards", type=int, required=True, help="number of shards"
+    )
+    parser_stitch.set_defaults(func=_stitch_shards)
+
     # Subcommand for 'run_model'
     parser_model = subparsers.add_parser("run_model", help="run a specified model")
     parser_model.add_argument(
@@ -123,6 +316,242 @@ def main():
     )
     parser_download.set_defaults(func=_download_data)
 
+    parser_export = subparsers.add_parser(
+        "export_embeddings", help="encode a dataset with a trained auto-encoder"
+    )
+    parser_export.add_argument(
+        "--dataset", required=True, help="hdf5 dataset file to encode"
+    )
+    parser_export.add_argument(
+        "--weights", required=True, help="saved ChartAutoEncoder state dict"
+    )
+    parser_export.add_argument(
+        "--output", required=True, help="hdf5 file to write the embeddings to"
+    )
+    parser_export.add_argument(
+        "--image-type",
+        type=dataset_enum_type,
+        choices=list(ImageType),
+        required=True,
+        help="image type the dataset was created with",
+    )
+    parser_export.add_argument(
+        "--embedding-size", type=int, default=64, help="size of the embedding"
+    )
+    parser_export.add_argument(
+        "--batch-size", type=int, default=4096, help="images encoded per batch"
+    )
+    parser_export.add_argument(
+        "--device", default="cpu", help="torch device to encode on"
+    )
+    parser_export.set_defaults(func=_export_embeddings)
+
+    parser_index = subparsers.add_parser(
+        "build_index", help="build a nearest neighbour index over embeddings"
+    )
+    parser_index.add_argument(
+        "--embeddings", required=True, help="hdf5 file from export_embeddings"
+    )
+    parser_index.add_argument(
+        "--output", required=True, help="destination .npz file for the index"
+    )
+    parser_index.add_argument(
+        "--index-type",
+        choices=list(INDEX_TYPES),
+        default="brute_force",
+        help="exact brute force search or approximate IVF-PQ search",
+    )
+    parser_index.add_argument(
+        "--n-lists", type=int, default=1024, help="IVF-PQ coarse clusters"
+    )
+    parser_index.add_argument(
+        "--n-subquantizers", type=int, default=8, help="IVF-PQ bytes per vector"
+    )
+    parser_index.add_argument(
+        "--n-probe", type=int, default=16, help="IVF-PQ clusters scanned per query"
+    )
+    parser_index.set_defaults(func=_build_index)
+
+    parser_similar = subparsers.add_parser(
+        "find_similar", help="find the charts most similar to a dataset row"
+    )
+    parser_similar.add_argument(
+        "--index", required=True, help=".npz file from build_index"
+    )
+    parser_similar.add_argument(
+        "--embeddings", required=True, help="hdf5 file from export_embeddings"
+    )
+    parser_similar.add_argument(
+        "--row", type=int, required=True, help="row of the chart to query with"
+    )
+    parser_similar.add_argument(
+        "-k", type=int, default=10, help="number of neighbours to return"
+    )
+    parser_similar.set_defaults(func=_find_similar)
+
+    parser_serve = subparsers.add_parser(
+        "serve", help="serve model scores over a local HTTP server"
+    )
+    parser_serve.add_argument(
+        "--weights", required=True, help="saved RIPTModel state dict"
+    )
+    parser_serve.add_argument(
+        "--image-type",
+        type=dataset_enum_type,
+        choices=list(ImageType),
+        required=True,
+        help="image type the model was trained on",
+    )
+    parser_serve.add_argument(
+        "--source", help="directory of ticker csv files to score by ticker"
+    )
+    parser_serve.add_argument("--host", default="127.0.0.1", help="address to bind")
+    parser_serve.add_argument("--port", type=int, default=8000, help="port to bind")
+    parser_serve.add_argument(
+        "--max-batch-size", type=int, default=64, help="most images scored at once"
+    )
+    parser_serve.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=5,
+        help="longest a request waits for a batch to fill",
+    )
+    parser_serve.add_argument("--device", default="cpu", help="torch device to use")
+    parser_serve.set_defaults(func=_serve)
+
+    parser_backtest = subparsers.add_parser(
+        "backtest", help="backtest decile portfolios formed on model predictions"
+    )
+    parser_backtest.add_argument(
+        "--dataset", required=True, help="hdf5 dataset holding the close prices"
+    )
+    parser_backtest.add_argument(
+        "--predictions",
+        required=True,
+        help="csv file with ticker, date and probability columns",
+    )
+    parser_backtest.add_argument(
+        "--horizons",
+        type=int,
+        nargs="+",
+        default=[5, 20, 60],
+        help="holding periods in trading days",
+    )
+    parser_backtest.add_argument(
+        "--deciles", type=int, default=10, help="number of portfolios"
+    )
+    parser_backtest.add_argument(
+        "--weighting",
+        choices=["equal", "volume"],
+        default="equal",
+        help="weight tickers equally or by dollar volume",
+    )
+    parser_backtest.set_defaults(func=_backtest)
+
+    parser_live = subparsers.add_parser(
+        "score_live", help="score the newest bar of every ticker incrementally"
+    )
+    parser_live.add_argument(
+        "--state",
+        required=True,
+        help="json file holding each ticker's recent rows, created if missing",
+    )
+    parser_live.add_argument(
+        "--bars",
+        required=True,
+        help="csv file with a Ticker column and one new OHLCV row per ticker",
+    )
+    parser_live.add_argument(
+        "--weights", required=True, help="saved RIPTModel state dict"
+    )
+    parser_live.add_argument(
+        "--image-type",
+        type=dataset_enum_type,
+        choices=list(ImageType),
+        default=ImageType.D5,
+        help="image type for a new state file",
+    )
+    parser_live.add_argument(
+        "--source", help="directory of ticker csv files to seed new tickers from"
+    )
+    parser_live.add_argument(
+        "--output", required=True, help="csv file to write the scores to"
+    )
+    parser_live.set_defaults(func=_score_live)
+
+    parser_repack = subparsers.add_parser(
+        "repack", help="rewrite a dataset with a new chunking, codec or order"
+    )
+    parser_repack.add_argument("--source", required=True, help="dataset to repack")
+    parser_repack.add_argument(
+        "--output", required=True, help="hdf5 file to write the repacked dataset to"
+    )
+    parser_repack.add_argument(
+        "--order",
+        choices=ORDERS,
+        help="sort by ticker then date, or by date then ticker",
+    )
+    parser_repack.add_argument(
+        "--chunk-rows", type=int, help="images per chunk, defaults to h5py's choice"
+    )
+    parser_repack.add_argument(
+        "--compression", choices=COMPRESSIONS, default="gzip", help="codec to use"
+    )
+    parser_repack.add_argument(
+        "--compression-level", type=int, default=4, help="gzip level"
+    )
+    parser_repack.add_argument(
+        "--image-dtype",
+        help="numpy dtype to store images as, e.g. uint8, must be lossless",
+    )
+    parser_repack.add_argument(
+        "--block-rows",
+        type=int,
+        default=16384,
+        help="rows held in memory at a time",
+    )
+    parser_repack.set_defaults(func=_repack)
+
+    parser_sweep = subparsers.add_parser(
+        "sweep", help="train a grid of RIPTModel hyperparameters concurrently"
+    )
+    parser_sweep.add_argument(
+        "--dataset",
+        nargs="+",
+        required=True,
+        help="hdf5 dataset files, one per image type to try",
+    )
+    parser_sweep.add_argument(
+        "--learning-rates", type=float, nargs="+", default=[1e-5], help="lr grid"
+    )
+    parser_sweep.add_argument(
+        "--dropouts", type=float, nargs="+", default=[0.5], help="dropout grid"
+    )
+    parser_sweep.add_argument(
+        "--horizons", type=int, nargs="+", default=[5], help="label horizon grid"
+    )
+    parser_sweep.add_argument(
+        "--epochs", type=int, default=10, help="most epochs to train each trial"
+    )
+    parser_sweep.add_argument(
+        "--batch-size", type=int, default=128, help="training batch size"
+    )
+    parser_sweep.add_argument(
+        "--max-concurrent",
+        type=int,
+        help="most trials trained at once, defaults to the number of cpus",
+    )
+    parser_sweep.add_argument(
+        "--grace-epochs",
+        type=int,
+        default=1,
+        help="epochs before poor trials can be stopped early",
+    )
+    parser_sweep.add_argument(
+        "--output", required=True, help="csv file to write the results table to"
+    )
+    parser_sweep.set_defaults(func=_sweep)
+
     args = parser.parse_args()
     args.func(args)
 
@@ -1,7 +1,37 @@
 import torch
 from torch.utils.data import Dataset
 import h5py
-import math
+import numpy as np
+from utils.shards import check_shards
+
+
+def journal_row_ranges(f):
+    """Each ticker's (start, end) rows, or the whole file if there's no journal."""
+    check_shards(f)
+    if f.attrs.get("order") == "date":
+        raise ValueError(
+            f"{f.filename} is sorted by date, labels need each ticker's rows to "
+            "be contiguous"
+        )
+    if "journal" not in f:
+        return [(0, len(f["close"]))]
+    return sorted(map(tuple, f["journal"]["rows"][:]))
+
+
+def labelled_idxs(closes, row_ranges, horizon):
+    """Rows with a valid close both at the row and ``horizon`` rows later.
+
+    Windows never cross from one ticker's rows into the next one's.
+    """
+    valid = ~np.isnan(closes)
+    idxs = [
+        np.arange(start, end - horizon)[
+            valid[start : end - horizon] & valid[start + horizon : end]
+        ]
+        for start, end in row_ranges
+        if end - start > horizon
+    ]
+    return np.concatenate(idxs) if idxs else np.empty(0, dtype=np.int64)
 
 
 class BinaryHorizonPredictionDataset(Dataset):
@@ -10,16 +40,10 @@ class BinaryHorizonPredictionDataset(Dataset):
         self.transform = transform
         self.horizon = horizon
         with h5py.File(self.file_path, "r") as f:
-            # Limit the dataset to only rows where there is a valid label
-            total_length = len(f["images"])
-            self.idxs = [
-                start
-                for start, end in zip(
-                    range(0, total_length), range(horizon, total_length)
-                )
-                if not math.isnan(f["closes"][start])
-                and not math.isnan(f["closes"][end])
-            ]
+            # Limit the dataset to only rows where there is a valid label, files
+            # with a journal (including stitched shards) keep tickers apart
+            row_ranges = journal_row_ranges(f)
+            self.idxs = labelled_idxs(f["close"][:], row_ranges, horizon)
             self.length = subset_length if subset_length is not None else len(self.idxs)
 
     def __len__(self):
@@ -28,10 +52,11 @@ class BinaryHorizonPredictionDataset(Dataset):
     def __getitem__(self, idx):
         relative_idx = self.idxs[idx]
         with h5py.File(self.file_path, "r") as f:
-            image = f["images"][relative_idx]
+            # Repacked datasets may store images as a smaller dtype
+            image = f["images"][relative_idx].astype(np.float32)
             label = (
                 (0, 1)
-                if f["closes"][relative_idx + self.horizon] > f["closes"][relative_idx]
+                if f["close"][relative_idx + self.horizon] > f["close"][relative_idx]
                 else (1, 0)
             )
 
@@ -0,0 +1,81 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.optim import Adam
+
+
+class ChartAutoEncoder(nn.Module):
+    """Convolutional auto-encoder for the generated chart images.
+
+    The encoder mirrors the convolution stack of RIPTModel but keeps the
+    spatial size with padding so that any ImageType can be reconstructed. The
+    bottleneck is a dense embedding of ``embedding_size`` floats.
+    """
+
+    def __init__(self, input_shape, embedding_size=64):
+        super(ChartAutoEncoder, self).__init__()
+        self.input_shape = tuple(input_shape)
+        self.embedding_size = embedding_size
+        channels, height, width = self.input_shape
+        self._bottleneck_shape = (128, height // 4, width)
+
+        # Encoder
+        self.conv1 = nn.Conv2d(channels, 64, (5, 3), padding=(2, 1))
+        self.bn1 = nn.BatchNorm2d(64)
+        self.maxpool1 = nn.MaxPool2d((2, 1))
+
+        self.conv2 = nn.Conv2d(64, 128, (5, 3), padding=(2, 1))
+        self.bn2 = nn.BatchNorm2d(128)
+        self.maxpool2 = nn.MaxPool2d((2, 1))
+
+        self.flatten = nn.Flatten()
+        bottleneck_features = 128 * (height // 4) * width
+        self.fc_encode = nn.Linear(bottleneck_features, embedding_size)
+
+        # Decoder
+        self.fc_decode = nn.Linear(embedding_size, bottleneck_features)
+        self.unflatten = nn.Unflatten(1, self._bottleneck_shape)
+
+        self.upsample1 = nn.Upsample(scale_factor=(2, 1))
+        self.deconv1 = nn.Conv2d(128, 64, (5, 3), padding=(2, 1))
+        self.bn3 = nn.BatchNorm2d(64)
+
+        # Resize to the exact input shape in case the height isn't divisible by 4
+        self.upsample2 = nn.Upsample(size=(height, width))
+        self.deconv2 = nn.Conv2d(64, channels, (5, 3), padding=(2, 1))
+
+    def encode(self, x):
+        x = F.leaky_relu(self.conv1(x))
+        x = self.bn1(x)
+        x = self.maxpool1(x)
+
+        x = F.leaky_relu(self.conv2(x))
+        x = self.bn2(x)
+        x = self.maxpool2(x)
+
+        x = self.flatten(x)
+        return self.fc_encode(x)
+
+    def decode(self, embedding):
+        x = F.leaky_relu(self.fc_decode(embedding))
+        x = self.unflatten(x)
+
+        x = self.upsample1(x)
+        x = F.leaky_relu(self.deconv1(x))
+        x = self.bn3(x)
+
+        x = self.upsample2(x)
+        x = self.deconv2(x)
+        # Images are binary pixel masks
+        return torch.sigmoid(x)
+
+    def forward(self, x):
+        return self.decode(self.encode(x))
+
+
+def create_auto_encoder_with_defaults(input_shape, embedding_size=64):
+    # input_shape = (3, 32, 15) for ImageType.D5
+    model = ChartAutoEncoder(input_shape, embedding_size=embedding_size)
+    optimizer = Adam(model.parameters(), lr=1e-3)
+    loss_fn = nn.BCELoss()
+    return model, optimizer, loss_fn
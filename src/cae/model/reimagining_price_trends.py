@@ -5,7 +5,7 @@ from torch.optim import Adam
 
 
 class RIPTModel(nn.Module):
-    def __init__(self, input_shape):
+    def __init__(self, input_shape, dropout=0.5):
         super(RIPTModel, self).__init__()
 
         self.conv1 = nn.Conv2d(input_shape[0], 64, (5, 3))
@@ -17,8 +17,11 @@ class RIPTModel(nn.Module):
         self.maxpool2 = nn.MaxPool2d((2, 1))
 
         self.flatten = nn.Flatten()
-        self.dropout = nn.Dropout(0.5)
-        self.fc = nn.Linear(64 * input_shape[1] // 4 * input_shape[2] // 2, 2)
+        self.dropout = nn.Dropout(dropout)
+        # Each (5, 3) convolution trims 4 rows and 2 columns, each pool halves the rows
+        height = ((input_shape[1] - 4) // 2 - 4) // 2
+        width = input_shape[2] - 4
+        self.fc = nn.Linear(128 * height * width, 2)
 
     def forward(self, x):
         x = F.leaky_relu(self.conv1(x))
@@ -35,9 +38,10 @@ class RIPTModel(nn.Module):
         return F.softmax(x, dim=1)
 
 
-def create_model_with_defaults(input_shape):
+def create_model_with_defaults(input_shape, lr=1e-5, dropout=0.5):
     # input_shape = (3, 64, 64)
-    model = RIPTModel(input_shape)
-    optimizer = Adam(model.parameters(), lr=1e-5)
-    loss_fn = nn.BCEWithLogitsLoss()
+    model = RIPTModel(input_shape, dropout=dropout)
+    optimizer = Adam(model.parameters(), lr=lr)
+    # The model outputs softmax probabilities rather than logits
+    loss_fn = nn.BCELoss()
     return model, optimizer, loss_fn
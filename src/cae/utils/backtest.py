@@ -0,0 +1,203 @@
+import csv
+from dataclasses import dataclass
+
+import h5py
+import numpy as np
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+@dataclass
+class Panel:
+    """Dense (date, ticker) matrices built from the flat dataset rows."""
+
+    dates: np.ndarray
+    tickers: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+    probability: np.ndarray
+
+
+@dataclass
+class BacktestResult:
+    horizon: int
+    dates: np.ndarray
+    # (rebalance date, decile) returns, decile 0 holds the lowest probabilities
+    decile_returns: np.ndarray
+    long_short_returns: np.ndarray
+    turnover: np.ndarray
+
+    @property
+    def periods_per_year(self):
+        return TRADING_DAYS_PER_YEAR / self.horizon
+
+    def sharpe(self, returns):
+        returns = returns[~np.isnan(returns)]
+        if len(returns) < 2 or returns.std(ddof=1) == 0:
+            return np.nan
+        return returns.mean() / returns.std(ddof=1) * np.sqrt(self.periods_per_year)
+
+    @property
+    def decile_sharpes(self):
+        return np.array([self.sharpe(r) for r in self.decile_returns.T])
+
+    @property
+    def long_short_sharpe(self):
+        return self.sharpe(self.long_short_returns)
+
+    @property
+    def mean_turnover(self):
+        return np.nanmean(self.turnover) if len(self.turnover) else np.nan
+
+
+def _normalize_dates(dates):
+    # Dataset dates are full isoformat timestamps, predictions may only be days
+    return np.asarray(dates).astype("U10")
+
+
+def build_panel(tickers, dates, close, volume, probability):
+    """Scatter flat per-row arrays into dense (date, ticker) matrices."""
+    dates = _normalize_dates(dates)
+    unique_dates, date_idx = np.unique(dates, return_inverse=True)
+    unique_tickers, ticker_idx = np.unique(tickers, return_inverse=True)
+    shape = (len(unique_dates), len(unique_tickers))
+
+    def scatter(values):
+        matrix = np.full(shape, np.nan)
+        matrix[date_idx, ticker_idx] = values
+        return matrix
+
+    return Panel(
+        dates=unique_dates,
+        tickers=unique_tickers,
+        close=scatter(close),
+        volume=scatter(volume),
+        probability=scatter(probability),
+    )
+
+
+def forward_returns(close, horizon):
+    returns = np.full_like(close, np.nan)
+    returns[:-horizon] = close[horizon:] / close[:-horizon] - 1
+    return returns
+
+
+def assign_deciles(scores, n_deciles=10):
+    """Cross-sectional bucket of every score per row, -1 where missing.
+
+    Buckets are assigned by rank so that each holds the same number of
+    tickers (give or take one) on every date.
+    """
+    valid = ~np.isnan(scores)
+    order = np.argsort(np.where(valid, scores, np.inf), axis=1, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(scores.shape[1])[None, :], axis=1)
+    counts = valid.sum(axis=1, keepdims=True)
+    deciles = ranks * n_deciles // np.maximum(counts, 1)
+    return np.where(valid, deciles, -1)
+
+
+def _leg_turnover(weights, returns):
+    """Fraction of a leg traded at each rebalance, including price drift."""
+    drifted = weights[:-1] * (1 + np.nan_to_num(returns[:-1]))
+    drifted /= np.maximum(drifted.sum(axis=1, keepdims=True), 1e-12)
+    turnover = np.full(len(weights), np.nan)
+    turnover[1:] = 0.5 * np.abs(weights[1:] - drifted).sum(axis=1)
+    return turnover
+
+
+def backtest(panel, horizon, n_deciles=10, weighting="equal"):
+    """Decile portfolio returns rebalanced every ``horizon`` trading days.
+
+    On each rebalance date tickers are bucketed by predicted probability and
+    held for ``horizon`` days. ``weighting`` is either ``"equal"`` or
+    ``"volume"``, the latter weighting by dollar volume on the rebalance
+    date. The long short portfolio buys the top decile and shorts the bottom.
+    """
+    rebalance = slice(0, len(panel.dates) - horizon, horizon)
+    returns = forward_returns(panel.close, horizon)[rebalance]
+    probability = panel.probability[rebalance].copy()
+    probability[np.isnan(returns)] = np.nan
+    deciles = assign_deciles(probability, n_deciles)
+
+    if weighting == "equal":
+        raw_weights = np.ones_like(returns)
+    elif weighting == "volume":
+        raw_weights = np.nan_to_num((panel.close * panel.volume)[rebalance])
+    else:
+        raise ValueError(f"Unknown weighting {weighting}")
+
+    # Sum weights and weighted returns per (date, decile) with one flat bincount
+    held = deciles >= 0
+    keys = np.arange(len(deciles))[:, None] * n_deciles + deciles
+    size = len(deciles) * n_deciles
+    totals = np.bincount(keys[held], weights=raw_weights[held], minlength=size)
+    sums = np.bincount(
+        keys[held], weights=(raw_weights * returns)[held], minlength=size
+    )
+    totals = totals.reshape(-1, n_deciles)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        decile_returns = np.where(
+            totals > 0, sums.reshape(-1, n_deciles) / totals, np.nan
+        )
+    long_short_returns = decile_returns[:, -1] - decile_returns[:, 0]
+
+    def leg_weights(decile):
+        in_leg = deciles == decile
+        leg_totals = np.where(in_leg, raw_weights, 0).sum(axis=1, keepdims=True)
+        return np.divide(
+            np.where(in_leg, raw_weights, 0),
+            leg_totals,
+            out=np.zeros_like(raw_weights),
+            where=leg_totals > 0,
+        )
+
+    turnover = (
+        _leg_turnover(leg_weights(n_deciles - 1), returns)
+        + _leg_turnover(leg_weights(0), returns)
+    ) / 2
+
+    return BacktestResult(
+        horizon=horizon,
+        dates=panel.dates[rebalance],
+        decile_returns=decile_returns,
+        long_short_returns=long_short_returns,
+        turnover=turnover,
+    )
+
+
+def load_predictions(path):
+    """Read a csv with ticker, date and probability columns."""
+    with open(path, "r") as predictions_file:
+        rows = list(csv.DictReader(predictions_file))
+    return (
+        np.array([row["ticker"] for row in rows]),
+        _normalize_dates([row["date"] for row in rows]),
+        np.array([float(row["probability"]) for row in rows]),
+    )
+
+
+def load_panel(dataset_path, predictions):
+    """Join (ticker, date, probability) predictions onto a dataset's prices."""
+    with h5py.File(dataset_path, "r") as dataset_file:
+        tickers = dataset_file["ticker"].asstr()[:]
+        dates = _normalize_dates(dataset_file["date"].asstr()[:])
+        close = dataset_file["close"][:]
+        volume = dataset_file["volume"][:]
+
+    panel = build_panel(tickers, dates, close, volume, np.full(len(close), np.nan))
+    prediction_tickers, prediction_dates, probability = predictions
+    ticker_idx = np.searchsorted(panel.tickers, prediction_tickers)
+    date_idx = np.searchsorted(panel.dates, prediction_dates)
+    # Drop predictions for tickers or dates that aren't in the dataset
+    known = (
+        (ticker_idx < len(panel.tickers))
+        & (date_idx < len(panel.dates))
+        & (
+            panel.tickers[np.minimum(ticker_idx, len(panel.tickers) - 1)]
+            == prediction_tickers
+        )
+        & (panel.dates[np.minimum(date_idx, len(panel.dates) - 1)] == prediction_dates)
+    )
+    panel.probability[date_idx[known], ticker_idx[known]] = probability[known]
+    return panel
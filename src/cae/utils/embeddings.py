@@ -0,0 +1,66 @@
+import h5py
+import numpy as np
+import torch
+from tqdm import tqdm
+from utils.shards import check_shards
+
+
+def _encode_batches(model, images, batch_size, device, quiet=False):
+    """Yield (start, embeddings) for contiguous slices of an HDF5 image dataset.
+
+    Reading contiguous slices lets h5py decompress whole chunks at a time
+    rather than one image per lookup.
+    """
+    model.eval()
+    with torch.no_grad():
+        for start in tqdm(
+            range(0, len(images), batch_size), desc="Encoding images", disable=quiet
+        ):
+            # Repacked datasets may store images as a smaller dtype
+            batch = torch.from_numpy(images[start : start + batch_size])
+            yield start, model.encode(batch.float().to(device)).cpu().numpy()
+
+
+def export_embeddings(
+    model,
+    dataset_path,
+    output_path,
+    batch_size=4096,
+    device="cpu",
+    quiet=False,
+):
+    """Encode every image in ``dataset_path`` and store them in ``output_path``.
+
+    The output file holds an ``embeddings`` matrix aligned row for row with the
+    source dataset, along with a copy of the ``ticker`` and ``date`` fields so
+    search results can be reported without reopening the source.
+    """
+    model = model.to(device)
+    with h5py.File(dataset_path, "r") as dataset_file, h5py.File(
+        output_path, "w"
+    ) as output_file:
+        check_shards(dataset_file)
+        images = dataset_file["images"]
+        embeddings = output_file.create_dataset(
+            "embeddings",
+            shape=(len(images), model.embedding_size),
+            dtype="float32",
+            chunks=(min(max(len(images), 1), batch_size), model.embedding_size),
+        )
+        for start, batch in _encode_batches(
+            model, images, batch_size, device, quiet=quiet
+        ):
+            embeddings[start : start + len(batch)] = batch
+
+        for field in ["ticker", "date"]:
+            if field in dataset_file:
+                # Write the values themselves, copying a stitched field would
+                # copy a virtual dataset pointing at shards next to the output
+                output_file.create_dataset(
+                    field, data=dataset_file[field][:], dtype=h5py.string_dtype()
+                )
+
+
+def load_embeddings(path):
+    with h5py.File(path, "r") as embeddings_file:
+        return np.asarray(embeddings_file["embeddings"][:], dtype=np.float32)
@@ -1,6 +1,7 @@
 import csv
 from functools import partial
 import math
+import os
 from enum import Enum
 
 import h5py
@@ -217,6 +218,28 @@ def _generate_images(rows, image_type):
         yield image, rows[end - 1]
 
 
+def render_image(processed_rows, image_type):
+    """Render the image for exactly ``image_type.candles`` processed rows."""
+    return _rows_to_image(processed_rows, image_type.pixel_height, image_type.candles)
+
+
+def render_latest_image(raw_rows, image_type):
+    """Render the image ending on the last of ``raw_rows``.
+
+    The moving average is computed over ``raw_rows`` so callers should pass
+    at least ``2 * image_type.candles - 1`` rows to match dataset images.
+    """
+    if len(raw_rows) < image_type.candles:
+        raise ValueError(
+            f"Need at least {image_type.candles} rows to render an image, "
+            f"got {len(raw_rows)}"
+        )
+    processed_rows = preprocess_rows(
+        raw_rows, moving_average_durations=[image_type.candles]
+    )
+    return render_image(processed_rows[-image_type.candles :], image_type)
+
+
 def _process_images_and_rows(raw_rows, image_type, moving_average_durations=[]):
     processed_rows = preprocess_rows(
         raw_rows, moving_average_durations=moving_average_durations
@@ -229,134 +252,232 @@ def _process_images_and_rows(raw_rows, image_type, moving_average_durations=[]):
     return images, rows
 
 
+_SCALAR_FIELDS = {
+    "high": "float32",
+    "low": "float32",
+    "open": "float32",
+    "close": "float32",
+    "volume": "float32",
+    "mvg_average": "float32",
+    "date": h5py.string_dtype(),
+    "ticker": h5py.string_dtype(),
+}
+FIELDS = ["images", *_SCALAR_FIELDS]
+JOURNAL = "journal"
+
+
+def _create_resizeable_dataset(h5_file, field, *, shape, dtype, compression_rate):
+    h5_file.create_dataset(
+        field,
+        shape=(0, *shape),
+        maxshape=(None, *shape),
+        dtype=dtype,
+        compression="gzip",
+        compression_opts=compression_rate,
+    )
+
+
+def _initialize_dataset_file(dataset_file, image_type, compression_rate):
+    # Reset any prexisting data
+    _remove_boundary(dataset_file)
+    for field in [*FIELDS, JOURNAL]:
+        if field in dataset_file:
+            del dataset_file[field]
+    _create_resizeable_dataset(
+        dataset_file,
+        "images",
+        shape=(3, image_type.pixel_height, 3 * image_type.candles),
+        dtype="f",
+        compression_rate=compression_rate,
+    )
+    for field, dtype in _SCALAR_FIELDS.items():
+        _create_resizeable_dataset(
+            dataset_file,
+            field,
+            shape=(),
+            dtype=dtype,
+            compression_rate=compression_rate,
+        )
+
+    # The journal records the [start, end) row range of every committed ticker.
+    # It is always written after the ticker's rows, so anything past the last
+    # journaled row is a partially written ticker.
+    journal = dataset_file.create_group(JOURNAL)
+    journal.create_dataset(
+        "ticker", shape=(0,), maxshape=(None,), dtype=h5py.string_dtype()
+    )
+    journal.create_dataset("rows", shape=(0, 2), maxshape=(None, 2), dtype="int64")
+    dataset_file.attrs["image_type"] = image_type.name
+    dataset_file.flush()
+
+
+def _boundary_path(dataset_file):
+    return f"{dataset_file.filename}.boundary"
+
+
+def _remove_boundary(dataset_file):
+    if os.path.exists(_boundary_path(dataset_file)):
+        os.remove(_boundary_path(dataset_file))
+
+
+def _save_boundary(dataset_file, committed_rows):
+    """Copy everything the next ticker's append can damage to a sidecar file.
+
+    Appending rewrites the compressed chunk holding the last committed rows,
+    and a process killed part way through can leave that chunk unreadable.
+    The committed rows of every boundary chunk and the journal are kept in
+    ``{dataset}.hdf5.boundary`` so a resume can restore them.
+    """
+    path = _boundary_path(dataset_file)
+    with h5py.File(f"{path}.tmp", "w") as boundary_file:
+        for field in FIELDS:
+            dset = dataset_file[field]
+            start = committed_rows - committed_rows % dset.chunks[0]
+            tail = boundary_file.create_dataset(
+                field, data=dset[start:committed_rows], dtype=dset.dtype
+            )
+            tail.attrs["start"] = start
+        for name, dset in dataset_file[JOURNAL].items():
+            boundary_file.create_dataset(
+                f"{JOURNAL}/{name}", data=dset[:], dtype=dset.dtype
+            )
+    # Rename so the sidecar on disk is always complete
+    os.replace(f"{path}.tmp", path)
+
+
+def _restore_boundary(dataset_file):
+    """Roll back to the state saved before the last ticker started writing."""
+    with h5py.File(_boundary_path(dataset_file), "r") as boundary_file:
+        for field in FIELDS:
+            tail = boundary_file[field]
+            # Shrinking to a chunk boundary drops the chunks the interrupted
+            # append touched without reading them back
+            dataset_file[field].resize(tail.attrs["start"], axis=0)
+            _append_to_hdf5_dataset(dataset_file, field, tail[:])
+        for name, dset in boundary_file[JOURNAL].items():
+            dataset_file[JOURNAL][name].resize(0, axis=0)
+            _append_to_hdf5_dataset(dataset_file[JOURNAL], name, dset[:])
+    dataset_file.flush()
+
+
+def read_journal(dataset_file):
+    """Return a dict of ticker -> (start, end) rows committed to the file."""
+    if JOURNAL not in dataset_file:
+        return {}
+    journal = dataset_file[JOURNAL]
+    return {
+        ticker.decode(): (int(start), int(end))
+        for ticker, (start, end) in zip(journal["ticker"][:], journal["rows"][:])
+    }
+
+
+def _can_resume(dataset_file, image_type):
+    return (
+        JOURNAL in dataset_file
+        and all(field in dataset_file for field in FIELDS)
+        and dataset_file.attrs.get("image_type") == image_type.name
+    )
+
+
+def _truncate_to_journal(dataset_file):
+    committed_rows = max(
+        (end for _, end in read_journal(dataset_file).values()), default=0
+    )
+    for field in FIELDS:
+        dset = dataset_file[field]
+        if dset.shape[0] < committed_rows:
+            raise ValueError(
+                f"Field {field} has {dset.shape[0]} rows but the journal has "
+                f"{committed_rows} committed, the dataset file is corrupt"
+            )
+        # Drop the tail of a ticker that was being written when the build died
+        dset.resize(committed_rows, axis=0)
+    return committed_rows
+
+
+def _commit_ticker(dataset_file, ticker_name, start, end):
+    _append_to_hdf5_dataset(dataset_file[JOURNAL], "ticker", np.array([ticker_name]))
+    _append_to_hdf5_dataset(dataset_file[JOURNAL], "rows", np.array([[start, end]]))
+    dataset_file.flush()
+
+
+def ticker_from_filename(filename):
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
 def create_dataset(
-    dataset_name, csv_files, image_type, quiet=False, compression_rate=4
+    dataset_name,
+    csv_files,
+    image_type,
+    quiet=False,
+    compression_rate=4,
+    resume=False,
 ):
+    """Render every csv file into images and append them to an hdf5 file.
+
+    Each ticker's rows are journaled and flushed to disk once written. With
+    ``resume`` set, a file left behind by an interrupted build keeps its
+    committed tickers, drops any partially written tail and only processes
+    the remaining files. The rows a killed build may have damaged while
+    writing its last ticker are restored from the boundary sidecar.
+    """
     with h5py.File(f"{dataset_name}.hdf5", "a") as dataset_file:
-        # Intialize resizeable datasets, reset any prexisting data
-        for field in [
-            "images",
-            "high",
-            "low",
-            "open",
-            "close",
-            "volume",
-            "mvg_average",
-            "date",
-            "ticker",
-        ]:
-            if field in dataset_file:
-                del dataset_file[field]
-        dataset_file.create_dataset(
-            "images",
-            shape=(0, 3, image_type.pixel_height, 3 * image_type.candles),
-            maxshape=(None, 3, image_type.pixel_height, 3 * image_type.candles),
-            dtype="f",
-            compression="gzip",
-            compression_rate=compression_rate,
-        )
-        dataset_file.create_dataset(
-            "high",
-            shape=(0,),
-            maxshape=(None,),
-            dtype="float32",
-            compression="gzip",
-            compression_rate=compression_rate,
-        )
-        dataset_file.create_dataset(
-            "low",
-            shape=(0,),
-            maxshape=(None,),
-            dtype="float32",
-            compression="gzip",
-            compression_rate=compression_rate,
-        )
-        dataset_file.create_dataset(
-            "open",
-            shape=(0,),
-            maxshape=(None,),
-            dtype="float32",
-            compression="gzip",
-            compression_rate=compression_rate,
-        )
-        dataset_file.create_dataset(
-            "close",
-            shape=(0,),
-            maxshape=(None,),
-            dtype="float32",
-            compression="gzip",
-            compression_rate=compression_rate,
-        )
-        dataset_file.create_dataset(
-            "volume",
-            shape=(0,),
-            maxshape=(None,),
-            dtype="float32",
-            compression="gzip",
-            compression_rate=compression_rate,
-        )
-        dataset_file.create_dataset(
-            "mvg_average",
-            shape=(0,),
-            maxshape=(None,),
-            dtype="float32",
-            compression="gzip",
-            compression_rate=compression_rate,
-        )
-        dataset_file.create_dataset(
-            "date",
-            shape=(0,),
-            maxshape=(None,),
-            dtype=h5py.string_dtype(),
-            compression="gzip",
-            compression_rate=compression_rate,
-        )
-        dataset_file.create_dataset(
-            "ticker",
-            shape=(0,),
-            maxshape=(None,),
-            dtype=h5py.string_dtype(),
-            compression="gzip",
-            compression_rate=compression_rate,
-        )
+        if resume and _can_resume(dataset_file, image_type):
+            if os.path.exists(_boundary_path(dataset_file)):
+                _restore_boundary(dataset_file)
+            committed_rows = _truncate_to_journal(dataset_file)
+            committed_tickers = set(read_journal(dataset_file))
+        else:
+            _initialize_dataset_file(dataset_file, image_type, compression_rate)
+            committed_rows = 0
+            committed_tickers = set()
 
         for filename in tqdm(csv_files, desc="Creating dataset files", disable=quiet):
+            ticker_name = ticker_from_filename(filename)
+            if ticker_name in committed_tickers:
+                continue
             with open(filename, "r") as source_file:
                 images, rows = _process_images_and_rows(
                     list(csv.DictReader(source_file)),
                     image_type,
                     moving_average_durations=[image_type.candles],
                 )
-                images = np.stack(images, axis=0)
-                _append_to_hdf5_dataset(dataset_file, "images", images)
-                _append_to_hdf5_dataset(
-                    dataset_file, "high", np.array([row.high for row in rows])
-                )
-                _append_to_hdf5_dataset(
-                    dataset_file, "low", np.array([row.low for row in rows])
-                )
+            _save_boundary(dataset_file, committed_rows)
+            if images:
                 _append_to_hdf5_dataset(
-                    dataset_file, "open", np.array([row.open for row in rows])
-                )
-                _append_to_hdf5_dataset(
-                    dataset_file, "close", np.array([row.close for row in rows])
-                )
-                _append_to_hdf5_dataset(
-                    dataset_file, "volume", np.array([row.volume for row in rows])
-                )
-                _append_to_hdf5_dataset(
-                    dataset_file,
-                    "mvg_average",
-                    np.array(
-                        [row.moving_averages.get(image_type.candles) for row in rows]
-                    ),
-                )
-                _append_to_hdf5_dataset(
-                    dataset_file,
-                    "date",
-                    np.array([row.date.isoformat() for row in rows]),
-                )
-                ticker_name = source_file.name.split("/")[-1].split(".")[0]
-                _append_to_hdf5_dataset(
-                    dataset_file, "ticker", np.array([ticker_name] * len(rows))
+                    dataset_file, "images", np.stack(images, axis=0)
                 )
+            _append_to_hdf5_dataset(
+                dataset_file, "high", np.array([row.high for row in rows])
+            )
+            _append_to_hdf5_dataset(
+                dataset_file, "low", np.array([row.low for row in rows])
+            )
+            _append_to_hdf5_dataset(
+                dataset_file, "open", np.array([row.open for row in rows])
+            )
+            _append_to_hdf5_dataset(
+                dataset_file, "close", np.array([row.close for row in rows])
+            )
+            _append_to_hdf5_dataset(
+                dataset_file, "volume", np.array([row.volume for row in rows])
+            )
+            _append_to_hdf5_dataset(
+                dataset_file,
+                "mvg_average",
+                np.array([row.moving_averages.get(image_type.candles) for row in rows]),
+            )
+            _append_to_hdf5_dataset(
+                dataset_file,
+                "date",
+                np.array([row.date.isoformat() for row in rows]),
+            )
+            _append_to_hdf5_dataset(
+                dataset_file, "ticker", np.array([ticker_name] * len(rows))
+            )
+            _commit_ticker(
+                dataset_file, ticker_name, committed_rows, committed_rows + len(rows)
+            )
+            committed_tickers.add(ticker_name)
+            committed_rows += len(rows)
+        _remove_boundary(dataset_file)
@@ -0,0 +1,164 @@
+from collections import deque
+import csv
+import datetime
+import json
+import os
+
+import numpy as np
+from utils.images import ImageType, render_image
+from utils.stock_history import MovingAverage, StockRow, coerce_time, process_row
+
+
+class _TickerState:
+    def __init__(self, image_type):
+        self.candles = image_type.candles
+        self.moving_average = MovingAverage(image_type.candles)
+        self.rows = deque(maxlen=image_type.candles)
+
+    def to_json(self):
+        return {
+            "moving_average": list(self.moving_average.values),
+            "rows": [
+                {
+                    "date": row.date.isoformat(),
+                    "high": row.high,
+                    "low": row.low,
+                    "open": row.open,
+                    "close": row.close,
+                    "volume": row.volume,
+                    "moving_average": row.moving_averages[self.candles],
+                }
+                for row in self.rows
+            ],
+        }
+
+    @classmethod
+    def from_json(cls, image_type, state):
+        ticker_state = cls(image_type)
+        for value in state["moving_average"]:
+            ticker_state.moving_average.add(value)
+        for row in state["rows"]:
+            ticker_state.rows.append(
+                StockRow(
+                    date=datetime.datetime.fromisoformat(row["date"]),
+                    high=row["high"],
+                    low=row["low"],
+                    open=row["open"],
+                    close=row["close"],
+                    volume=row["volume"],
+                    moving_averages={image_type.candles: row["moving_average"]},
+                )
+            )
+        return ticker_state
+
+
+class LiveImageEngine:
+    """Render only the newest image per ticker as daily bars arrive.
+
+    Every ticker keeps its last ``candles`` processed rows and the running
+    moving average, which is all an image depends on, so adding a bar costs
+    the same regardless of how much history the ticker has. Images match the
+    ones create_dataset renders from the full history.
+    """
+
+    def __init__(self, image_type):
+        self.image_type = image_type
+        self._tickers = {}
+
+    def __contains__(self, ticker):
+        return ticker in self._tickers
+
+    def __len__(self):
+        return len(self._tickers)
+
+    def add_bar(self, ticker, raw_row):
+        """Add a raw csv style row and return the image ending on it.
+
+        Returns None until the ticker has ``candles`` rows, or if the bar isn't
+        newer than the last one seen so that rerunning a day is harmless.
+        """
+        if ticker not in self._tickers:
+            self._tickers[ticker] = _TickerState(self.image_type)
+        state = self._tickers[ticker]
+        if state.rows and coerce_time(raw_row) <= state.rows[-1].date:
+            return None
+        state.rows.append(
+            process_row(raw_row, {self.image_type.candles: state.moving_average})
+        )
+        if len(state.rows) < self.image_type.candles:
+            return None
+        return render_image(list(state.rows), self.image_type)
+
+    def warm_up(self, ticker, raw_rows):
+        """Seed a ticker from its history, only the tail of which is needed."""
+        image = None
+        for raw_row in list(raw_rows)[-(2 * self.image_type.candles - 1) :]:
+            image = self.add_bar(ticker, raw_row)
+        return image
+
+    def update(self, bars):
+        """Add one bar for each ticker in ``bars``, returning the new images."""
+        images = {}
+        for ticker, raw_row in bars.items():
+            image = self.add_bar(ticker, raw_row)
+            if image is not None:
+                images[ticker] = image
+        return images
+
+    def score(self, bars, predict):
+        """Add the bars and score every new image in a single batch."""
+        images = self.update(bars)
+        if not images:
+            return {}
+        probabilities = predict(np.stack(list(images.values())))
+        return dict(zip(images, probabilities))
+
+    def save(self, path):
+        state = {
+            "image_type": self.image_type.name,
+            "tickers": {
+                ticker: ticker_state.to_json()
+                for ticker, ticker_state in self._tickers.items()
+            },
+        }
+        # Write then rename so a crash never leaves a truncated state file
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w") as state_file:
+            json.dump(state, state_file)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as state_file:
+            state = json.load(state_file)
+        engine = cls(ImageType.from_string(state["image_type"]))
+        engine._tickers = {
+            ticker: _TickerState.from_json(engine.image_type, ticker_state)
+            for ticker, ticker_state in state["tickers"].items()
+        }
+        return engine
+
+
+def read_bars(path):
+    """Read a csv of the latest bars with a Ticker column, one row per ticker."""
+    with open(path, "r") as bars_file:
+        return {
+            row.pop("Ticker", row.pop("ticker", None)): row
+            for row in csv.DictReader(bars_file)
+        }
+
+
+def warm_up_from_source(engine, tickers, source):
+    """Seed any tickers the engine hasn't seen yet from their csv history."""
+    for ticker in tickers:
+        path = os.path.join(source, f"{ticker}.csv")
+        if ticker in engine or not os.path.exists(path):
+            continue
+        with open(path, "r") as source_file:
+            engine.warm_up(
+                ticker,
+                deque(
+                    csv.DictReader(source_file),
+                    maxlen=2 * engine.image_type.candles - 1,
+                ),
+            )
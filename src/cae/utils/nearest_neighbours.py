@@ -0,0 +1,288 @@
+import numpy as np
+
+
+def _squared_norms(data):
+    return np.einsum("ij,ij->i", data, data)
+
+
+def _squared_distances(queries, data, data_norms=None):
+    """Squared euclidean distances between every query and every data row.
+
+    Expands ||q - x||^2 = ||q||^2 - 2 q.x + ||x||^2 so that the bulk of the
+    work is a single matrix multiply.
+    """
+    if data_norms is None:
+        data_norms = _squared_norms(data)
+    distances = _squared_norms(queries)[:, None] - 2 * queries @ data.T
+    distances += data_norms[None, :]
+    # Rounding can push distances of identical vectors slightly negative
+    np.maximum(distances, 0, out=distances)
+    return distances
+
+
+def _top_k(distances, k):
+    """Row-wise indices of the k smallest distances, sorted ascending."""
+    k = min(k, distances.shape[1])
+    if k == 0:
+        return np.empty((distances.shape[0], 0), dtype=np.int64)
+    candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    candidate_distances = np.take_along_axis(distances, candidates, axis=1)
+    order = np.argsort(candidate_distances, axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def _merge_top_k(best_distances, best_indices, distances, indices, k):
+    all_distances = np.concatenate((best_distances, distances), axis=1)
+    all_indices = np.concatenate((best_indices, indices), axis=1)
+    order = _top_k(all_distances, k)
+    return (
+        np.take_along_axis(all_distances, order, axis=1),
+        np.take_along_axis(all_indices, order, axis=1),
+    )
+
+
+def _assign(data, centroids, block_size=65536):
+    """Index of the closest centroid for every row, computed in blocks."""
+    centroid_norms = _squared_norms(centroids)
+    labels = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), block_size):
+        block = data[start : start + block_size]
+        labels[start : start + block_size] = np.argmin(
+            _squared_distances(block, centroids, centroid_norms), axis=1
+        )
+    return labels
+
+
+def _kmeans(data, n_clusters, *, n_iter=20, rng):
+    if len(data) < n_clusters:
+        raise ValueError(
+            f"Need at least {n_clusters} vectors to train, got {len(data)}"
+        )
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = _assign(data, centroids)
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        non_empty = counts > 0
+        centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+        # Re-seed empty clusters on random points so every centroid is used
+        empty = np.flatnonzero(~non_empty)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+class BruteForceIndex:
+    """Exact nearest neighbours via blocked matrix multiplication.
+
+    The embedding matrix is scanned ``block_size`` rows at a time so that the
+    intermediate distance matrix stays bounded regardless of the number of
+    stored vectors.
+    """
+
+    kind = "brute_force"
+
+    def __init__(self, embeddings, block_size=65536):
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.block_size = block_size
+        self._norms = _squared_norms(self.embeddings)
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def search(self, queries, k=10):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        best_distances = np.empty((len(queries), 0), dtype=np.float32)
+        best_indices = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self.embeddings), self.block_size):
+            end = start + self.block_size
+            distances = _squared_distances(
+                queries, self.embeddings[start:end], self._norms[start:end]
+            )
+            block_best = _top_k(distances, k)
+            best_distances, best_indices = _merge_top_k(
+                best_distances,
+                best_indices,
+                np.take_along_axis(distances, block_best, axis=1),
+                block_best + start,
+                k,
+            )
+        return best_distances, best_indices
+
+    def save(self, path):
+        np.savez(
+            path, kind=self.kind, embeddings=self.embeddings, block_size=self.block_size
+        )
+
+    @classmethod
+    def _from_archive(cls, archive):
+        return cls(archive["embeddings"], block_size=int(archive["block_size"]))
+
+
+class IVFPQIndex:
+    """Approximate nearest neighbours with an inverted file and product quantizer.
+
+    Vectors are bucketed by their closest coarse centroid (``n_lists`` of
+    them) and the residual to that centroid is compressed into
+    ``n_subquantizers`` one byte codes. A search only scans the ``n_probe``
+    closest buckets and scores candidates with per-query lookup tables, so
+    memory use is roughly ``n_subquantizers`` bytes per vector.
+    """
+
+    kind = "ivfpq"
+
+    def __init__(self, n_lists=1024, n_subquantizers=8, n_probe=16, seed=0):
+        self.n_lists = n_lists
+        self.n_subquantizers = n_subquantizers
+        self.n_probe = n_probe
+        self.seed = seed
+        self.n_codes = 256
+        self.coarse_centroids = None
+        self.codebooks = None
+        self.list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        self.codes = np.empty((0, n_subquantizers), dtype=np.uint8)
+        self.ids = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def is_trained(self):
+        return self.codebooks is not None
+
+    def _split(self, vectors):
+        return vectors.reshape(len(vectors), self.n_subquantizers, -1)
+
+    def train(self, embeddings, sample_size=262144):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.shape[1] % self.n_subquantizers:
+            raise ValueError(
+                f"Embedding size {embeddings.shape[1]} is not divisible by "
+                f"{self.n_subquantizers} subquantizers"
+            )
+        rng = np.random.default_rng(self.seed)
+        if len(embeddings) > sample_size:
+            embeddings = embeddings[
+                np.sort(rng.choice(len(embeddings), sample_size, replace=False))
+            ]
+
+        self.coarse_centroids = _kmeans(embeddings, self.n_lists, rng=rng)
+        residuals = self._split(
+            embeddings
+            - self.coarse_centroids[_assign(embeddings, self.coarse_centroids)]
+        )
+        self.codebooks = np.stack(
+            [
+                _kmeans(np.ascontiguousarray(residuals[:, m]), self.n_codes, rng=rng)
+                for m in range(self.n_subquantizers)
+            ]
+        )
+        return self
+
+    def _encode(self, residuals):
+        residuals = self._split(residuals)
+        codes = np.empty((len(residuals), self.n_subquantizers), dtype=np.uint8)
+        for m in range(self.n_subquantizers):
+            codes[:, m] = _assign(
+                np.ascontiguousarray(residuals[:, m]), self.codebooks[m]
+            )
+        return codes
+
+    def add(self, embeddings, ids=None):
+        if not self.is_trained:
+            raise RuntimeError("The index must be trained before adding vectors")
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if ids is None:
+            ids = np.arange(len(self), len(self) + len(embeddings))
+        lists = _assign(embeddings, self.coarse_centroids)
+        codes = self._encode(embeddings - self.coarse_centroids[lists])
+
+        # Keep the inverted lists contiguous by re-sorting on list id
+        existing_lists = np.repeat(np.arange(self.n_lists), np.diff(self.list_offsets))
+        all_lists = np.concatenate((existing_lists, lists))
+        order = np.argsort(all_lists, kind="stable")
+        self.codes = np.concatenate((self.codes, codes))[order]
+        self.ids = np.concatenate((self.ids, np.asarray(ids, dtype=np.int64)))[order]
+        self.list_offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(all_lists, minlength=self.n_lists)))
+        )
+        return self
+
+    def _search_one(self, query, probed_lists, k):
+        candidate_distances = []
+        candidate_ids = []
+        subquantizer_index = np.arange(self.n_subquantizers)
+        for list_id in probed_lists:
+            start, end = self.list_offsets[list_id], self.list_offsets[list_id + 1]
+            if start == end:
+                continue
+            residual = self._split((query - self.coarse_centroids[list_id])[None])[0]
+            # (n_subquantizers, n_codes) distances of every sub-vector to its codes
+            table = ((self.codebooks - residual[:, None, :]) ** 2).sum(axis=2)
+            candidate_distances.append(
+                table[subquantizer_index, self.codes[start:end]].sum(axis=1)
+            )
+            candidate_ids.append(self.ids[start:end])
+        if not candidate_distances:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        distances = np.concatenate(candidate_distances)
+        best = _top_k(distances[None], k)[0]
+        return distances[best], np.concatenate(candidate_ids)[best]
+
+    def search(self, queries, k=10):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        n_probe = min(self.n_probe, self.n_lists)
+        probes = _top_k(_squared_distances(queries, self.coarse_centroids), n_probe)
+
+        # Pad with inf / -1 when fewer than k candidates were found
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, (query, probed_lists) in enumerate(zip(queries, probes)):
+            found_distances, found_ids = self._search_one(query, probed_lists, k)
+            distances[row, : len(found_ids)] = found_distances
+            indices[row, : len(found_ids)] = found_ids
+        return distances, indices
+
+    def save(self, path):
+        np.savez(
+            path,
+            kind=self.kind,
+            n_probe=self.n_probe,
+            seed=self.seed,
+            coarse_centroids=self.coarse_centroids,
+            codebooks=self.codebooks,
+            list_offsets=self.list_offsets,
+            codes=self.codes,
+            ids=self.ids,
+        )
+
+    @classmethod
+    def _from_archive(cls, archive):
+        codebooks = archive["codebooks"]
+        index = cls(
+            n_lists=len(archive["coarse_centroids"]),
+            n_subquantizers=codebooks.shape[0],
+            n_probe=int(archive["n_probe"]),
+            seed=int(archive["seed"]),
+        )
+        index.coarse_centroids = archive["coarse_centroids"]
+        index.codebooks = codebooks
+        index.list_offsets = archive["list_offsets"]
+        index.codes = archive["codes"]
+        index.ids = archive["ids"]
+        return index
+
+
+INDEX_TYPES = {index.kind: index for index in [BruteForceIndex, IVFPQIndex]}
+
+
+def build_index(embeddings, kind="brute_force", **kwargs):
+    if kind == BruteForceIndex.kind:
+        return BruteForceIndex(embeddings, **kwargs)
+    return IVFPQIndex(**kwargs).train(embeddings).add(embeddings)
+
+
+def load_index(path):
+    with np.load(path) as archive:
+        return INDEX_TYPES[str(archive["kind"])]._from_archive(archive)
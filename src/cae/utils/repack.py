@@ -0,0 +1,281 @@
+import hashlib
+import os
+
+import h5py
+import numpy as np
+from tqdm import tqdm
+from utils.images import FIELDS, JOURNAL
+from utils.shards import check_shards
+
+ORDERS = ["ticker", "date"]
+COMPRESSIONS = ["gzip", "lzf", "none"]
+_SHARD_ATTRS = {"shards", "shard_files", "shard_rows"}
+
+
+def _sort_permutation(source_file, order):
+    if order is None:
+        return None
+    tickers = source_file["ticker"].asstr()[:]
+    dates = source_file["date"].asstr()[:]
+    # lexsort sorts by the last key first
+    keys = (dates, tickers) if order == "ticker" else (tickers, dates)
+    return np.lexsort(keys)
+
+
+def _slab_rows(source, block_rows):
+    """Rows per sequential read, aligned so every source chunk is read once."""
+    chunk_rows = source.chunks[0] if source.chunks else 1
+    return max(chunk_rows, block_rows // chunk_rows * chunk_rows)
+
+
+def _scatter_through_scratch(source, permutation, block_rows, scratch_path, digest):
+    """Reorder rows out of core via an uncompressed scratch file.
+
+    The source is read sequentially and every row is written to its output
+    position in a memory mapped scratch file, which is then read back in
+    order. Each compressed source chunk is only decompressed once and memory
+    stays bounded by a single slab.
+    """
+    positions = np.empty_like(permutation)
+    positions[permutation] = np.arange(len(permutation))
+    slab_rows = _slab_rows(source, block_rows)
+    scratch = np.memmap(scratch_path, dtype=source.dtype, mode="w+", shape=source.shape)
+    try:
+        for start in range(0, len(source), slab_rows):
+            slab = source[start : start + slab_rows]
+            digest.update(slab, start)
+            scratch[positions[start : start + len(slab)]] = slab
+        scratch.flush()
+        for start in range(0, len(source), block_rows):
+            yield np.array(scratch[start : start + block_rows])
+    finally:
+        del scratch
+        os.remove(scratch_path)
+
+
+def _blocks_in_output_order(source, permutation, block_rows, scratch_path, digest):
+    """Yield the source rows in output order, adding them to ``digest`` as read."""
+    if permutation is None:
+        slab_rows = _slab_rows(source, block_rows)
+        for start in range(0, len(source), slab_rows):
+            slab = source[start : start + slab_rows]
+            digest.update(slab, start)
+            yield slab
+    elif source.ndim == 1:
+        # Scalar fields are small enough to reorder in memory
+        data = source[:]
+        digest.update(data, 0)
+        data = data[permutation]
+        for start in range(0, len(data), block_rows):
+            yield data[start : start + block_rows]
+    elif len(source):
+        yield from _scatter_through_scratch(
+            source, permutation, block_rows, scratch_path, digest
+        )
+
+
+def _row_keys(dataset_file):
+    """A hash of every row's ticker and date, in the file's row order."""
+    tickers = dataset_file["ticker"].asstr()[:]
+    dates = dataset_file["date"].asstr()[:]
+    return b"".join(
+        hashlib.blake2b(f"{ticker}\0{date}".encode(), digest_size=8).digest()
+        for ticker, date in zip(tickers, dates)
+    )
+
+
+class _FieldDigest:
+    """Order independent digest of a field's rows.
+
+    Every value is hashed along with the key of the row it belongs to and the
+    hashes are summed modulo 2**64. The digest changes if a value is altered,
+    lost, duplicated or moved to another row, but not with the row order or
+    how the rows are split into blocks.
+    """
+
+    def __init__(self, row_keys):
+        self._row_keys = memoryview(row_keys)
+        self.value = 0
+
+    def update(self, rows, start):
+        if rows.dtype.kind == "O":
+            # Variable length strings, hash their contents rather than pointers
+            values = [v if isinstance(v, bytes) else v.encode() for v in rows]
+        else:
+            data = memoryview(np.ascontiguousarray(rows).tobytes())
+            size = len(data) // max(len(rows), 1)
+            values = [data[i * size : (i + 1) * size] for i in range(len(rows))]
+        total = self.value
+        for row, value in enumerate(values, start):
+            row_hash = hashlib.blake2b(
+                self._row_keys[8 * row : 8 * (row + 1)], digest_size=8
+            )
+            row_hash.update(value)
+            total += int.from_bytes(row_hash.digest(), "little")
+        self.value = total % 2**64
+
+    def hexdigest(self):
+        return f"{self.value:016x}"
+
+
+def _convert(field, data, image_dtype):
+    if field != "images" or image_dtype is None:
+        return data
+    converted = data.astype(image_dtype)
+    if not np.array_equal(converted.astype(data.dtype), data, equal_nan=True):
+        raise ValueError(f"Converting images to {image_dtype} would lose information")
+    return converted
+
+
+def _journal_rows(tickers):
+    """Row range of every run of one ticker in ticker sorted rows."""
+    if not len(tickers):
+        return tickers, np.empty((0, 2), dtype=np.int64)
+    boundaries = np.flatnonzero(tickers[1:] != tickers[:-1]) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(tickers)]))
+    return tickers[starts], np.stack((starts, ends), axis=1)
+
+
+def _write_journal(source_file, output_file, order, permutation):
+    if order == "date" or (order is None and JOURNAL not in source_file):
+        # Tickers aren't contiguous so there are no row ranges to record
+        return
+    if order is None:
+        source_file.copy(source_file[JOURNAL], output_file, name=JOURNAL)
+        return
+    tickers, rows = _journal_rows(source_file["ticker"].asstr()[:][permutation])
+    journal = output_file.create_group(JOURNAL)
+    journal.create_dataset(
+        "ticker",
+        data=tickers.astype(object),
+        maxshape=(None,),
+        dtype=h5py.string_dtype(),
+    )
+    journal.create_dataset("rows", data=rows, maxshape=(None, 2), dtype="int64")
+
+
+def _verify(output_path, source_digests, source_dtypes, block_rows):
+    """Check every field of the written file holds exactly the source's rows."""
+    with h5py.File(output_path, "r") as output_file:
+        row_keys = _row_keys(output_file)
+        for field, expected in source_digests.items():
+            dataset = output_file[field]
+            digest = _FieldDigest(row_keys)
+            for start in range(0, len(dataset), block_rows):
+                # Compare converted images by their values in the source dtype
+                block = dataset[start : start + block_rows]
+                digest.update(block.astype(source_dtypes[field], copy=False), start)
+            if digest.hexdigest() != expected:
+                raise ValueError(
+                    f"{field} in {output_path} doesn't hold the same rows as the "
+                    "source"
+                )
+
+
+def _write_repacked(
+    source_path,
+    temporary_path,
+    scratch_path,
+    *,
+    order,
+    chunk_rows,
+    compression,
+    compression_level,
+    image_dtype,
+    block_rows,
+    quiet,
+):
+    digests, dtypes = {}, {}
+    with h5py.File(source_path, "r") as source_file, h5py.File(
+        temporary_path, "w"
+    ) as output_file:
+        check_shards(source_file)
+        permutation = _sort_permutation(source_file, order)
+        row_keys = _row_keys(source_file)
+        n_rows = len(source_file["images"])
+        for field in FIELDS:
+            source = source_file[field]
+            dtype = image_dtype if field == "images" and image_dtype else source.dtype
+            output = output_file.create_dataset(
+                field,
+                shape=source.shape,
+                maxshape=(None, *source.shape[1:]),
+                dtype=dtype,
+                chunks=(
+                    (min(chunk_rows, max(n_rows, 1)), *source.shape[1:])
+                    if chunk_rows and field == "images"
+                    else True
+                ),
+                compression=None if compression == "none" else compression,
+                compression_opts=compression_level if compression == "gzip" else None,
+            )
+            digest = _FieldDigest(row_keys)
+            written = 0
+            for block in tqdm(
+                _blocks_in_output_order(
+                    source, permutation, block_rows, scratch_path, digest
+                ),
+                desc=f"Repacking {field}",
+                disable=quiet,
+            ):
+                data = _convert(field, block, image_dtype)
+                output[written : written + len(data)] = data
+                written += len(data)
+            digests[field] = digest.hexdigest()
+            dtypes[field] = source.dtype
+
+        _write_journal(source_file, output_file, order, permutation)
+        for key, value in source_file.attrs.items():
+            # The repacked file is a single file even if the source was stitched
+            if key not in _SHARD_ATTRS:
+                output_file.attrs[key] = value
+        if order is not None:
+            output_file.attrs["order"] = order
+    return digests, dtypes
+
+
+def repack(
+    source_path,
+    output_path,
+    *,
+    order=None,
+    chunk_rows=None,
+    compression="gzip",
+    compression_level=4,
+    image_dtype=None,
+    block_rows=16384,
+    quiet=False,
+):
+    """Rewrite a dataset with a new layout without rendering anything again.
+
+    Rows are streamed about ``block_rows`` at a time so memory stays bounded
+    by the block size and the scalar fields. ``order`` re-sorts rows by
+    ``"ticker"`` then date, or by ``"date"`` then ticker for cross-sectional
+    loading, going through a scratch file next to ``output_path`` the size of
+    the uncompressed images. ``image_dtype`` can shrink images, e.g. to uint8,
+    but only if no pixel changes. Every field gets an order independent
+    digest of the rows read from the source, which must match the digest of
+    the new file read back before it replaces ``output_path``.
+    """
+    temporary_path = f"{output_path}.tmp"
+    try:
+        digests, dtypes = _write_repacked(
+            source_path,
+            temporary_path,
+            f"{output_path}.scratch",
+            order=order,
+            chunk_rows=chunk_rows,
+            compression=compression,
+            compression_level=compression_level,
+            image_dtype=image_dtype,
+            block_rows=block_rows,
+            quiet=quiet,
+        )
+        _verify(temporary_path, digests, dtypes, block_rows)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    os.replace(temporary_path, output_path)
+    return digests
@@ -0,0 +1,266 @@
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import csv
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import torch
+from utils.images import render_latest_image
+
+
+class ScoringMetrics:
+    """Rolling request latency and batch size statistics."""
+
+    def __init__(self, window=10000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._batch_sizes = deque(maxlen=window)
+        self.requests = 0
+        self.batches = 0
+
+    def record_request(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+            self.requests += 1
+
+    def record_batch(self, size):
+        with self._lock:
+            self._batch_sizes.append(size)
+            self.batches += 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = np.array(self._latencies)
+            batch_sizes = np.array(self._batch_sizes)
+            requests, batches = self.requests, self.batches
+
+        def percentile(values, q):
+            return float(np.percentile(values, q)) if len(values) else None
+
+        return {
+            "requests": requests,
+            "batches": batches,
+            "latency_ms_p50": percentile(latencies * 1000, 50),
+            "latency_ms_p99": percentile(latencies * 1000, 99),
+            "batch_size_mean": float(batch_sizes.mean()) if len(batch_sizes) else None,
+            "batch_size_p50": percentile(batch_sizes, 50),
+            "batch_size_max": int(batch_sizes.max()) if len(batch_sizes) else None,
+        }
+
+
+class MicroBatcher:
+    """Coalesce concurrently submitted images into batched predict calls.
+
+    A single worker thread waits for the first queued image, then keeps
+    collecting until either ``max_batch_size`` images are queued or
+    ``max_wait`` seconds have passed since that first image arrived.
+    """
+
+    def __init__(self, predict, max_batch_size=64, max_wait=0.005, metrics=None):
+        self._predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.metrics = metrics if metrics is not None else ScoringMetrics()
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._worker.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._worker.join()
+
+    def submit(self, image):
+        future = Future()
+        self._queue.put((image, future))
+        return future
+
+    def _collect_batch(self):
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            images, futures = zip(*batch)
+            self.metrics.record_batch(len(batch))
+            try:
+                scores = self._predict(np.stack(images))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, score in zip(futures, scores):
+                future.set_result(score)
+
+
+def model_predictor(model, device="cpu"):
+    """Wrap a RIPTModel into a function from an image batch to up probabilities."""
+    model = model.to(device)
+    model.eval()
+
+    def predict(images):
+        with torch.no_grad():
+            batch = torch.from_numpy(images.astype(np.float32)).to(device)
+            return model(batch)[:, 1].cpu().tolist()
+
+    return predict
+
+
+def _read_tail(path, rows):
+    with open(path, "r") as source_file:
+        return list(deque(csv.DictReader(source_file), maxlen=rows))
+
+
+class ScoringService:
+    def __init__(self, batcher, image_type, source=None, timeout=30):
+        self.batcher = batcher
+        self.image_type = image_type
+        self.source = source
+        self.timeout = timeout
+        # path -> ((mtime, size), rows) so a ticker's csv is only parsed again
+        # once it changes
+        self._tails = {}
+        self._tails_lock = threading.Lock()
+
+    def _latest_rows(self, ticker):
+        if self.source is None:
+            raise ValueError("The server was started without a --source directory")
+        path = os.path.join(self.source, f"{os.path.basename(ticker)}.csv")
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise ValueError(f"No history for ticker {ticker}")
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._tails_lock:
+            cached = self._tails.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        # Enough rows for the image and a full moving average on its first day
+        rows = _read_tail(path, 2 * self.image_type.candles)
+        with self._tails_lock:
+            self._tails[path] = (version, rows)
+        return rows
+
+    def score(self, request):
+        start = time.monotonic()
+        if not isinstance(request, dict):
+            raise ValueError("Request must be a JSON object")
+        if "rows" in request:
+            rows = request["rows"]
+            if not isinstance(rows, list) or not all(
+                isinstance(row, dict) for row in rows
+            ):
+                raise ValueError("'rows' must be a list of csv style row objects")
+        elif "ticker" in request:
+            rows = self._latest_rows(request["ticker"])
+        else:
+            raise ValueError("Request needs either 'rows' or 'ticker'")
+        image = render_latest_image(rows, self.image_type)
+        score = self.batcher.submit(image).result(timeout=self.timeout)
+        self.batcher.metrics.record_request(time.monotonic() - start)
+        return {
+            "date": rows[-1].get("Date", rows[-1].get("date")),
+            "probability_up": score,
+        }
+
+
+def _make_handler(service):
+    class ScoringHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._send_json(200, service.batcher.metrics.snapshot())
+            elif self.path == "/health":
+                self._send_json(200, {"status": "ok"})
+            else:
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/score":
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+                return
+            try:
+                request = json.loads(
+                    self.rfile.read(int(self.headers["Content-Length"]))
+                )
+                self._send_json(200, service.score(request))
+            except FutureTimeoutError:
+                # Not a subclass of the builtin TimeoutError before Python 3.11
+                self._send_json(503, {"error": "Timed out waiting for the model"})
+            except (ValueError, KeyError, TypeError) as e:
+                # Missing Content-Length, bad JSON or rows missing their fields
+                self._send_json(400, {"error": f"Malformed request: {e}"})
+            except Exception as e:
+                self._send_json(500, {"error": f"Scoring failed: {e}"})
+
+        def log_message(self, format, *args):
+            # Per request logging would dominate the latency being measured
+            pass
+
+    return ScoringHandler
+
+
+def create_server(service, host="127.0.0.1", port=8000):
+    return ThreadingHTTPServer((host, port), _make_handler(service))
+
+
+def serve(
+    model,
+    image_type,
+    host="127.0.0.1",
+    port=8000,
+    source=None,
+    max_batch_size=64,
+    max_wait=0.005,
+    device="cpu",
+):
+    """Serve model scores over HTTP until interrupted.
+
+    ``POST /score`` takes ``{"rows": [...]}`` with csv style OHLCV rows or
+    ``{"ticker": "AAPL"}`` to score the latest window in ``source``.
+    ``GET /metrics`` reports latency percentiles and batch sizes.
+    """
+    batcher = MicroBatcher(
+        model_predictor(model, device),
+        max_batch_size=max_batch_size,
+        max_wait=max_wait,
+    ).start()
+    server = create_server(ScoringService(batcher, image_type, source), host, port)
+    print(f"Serving on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.stop()
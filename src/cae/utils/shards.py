@@ -0,0 +1,191 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+import zlib
+
+import h5py
+import numpy as np
+from tqdm import tqdm
+from utils.images import (
+    FIELDS,
+    JOURNAL,
+    create_dataset,
+    read_journal,
+    ticker_from_filename,
+)
+
+
+def shard_for_ticker(ticker, n_shards):
+    # crc32 rather than hash() so the assignment is stable across processes
+    # and machines
+    return zlib.crc32(ticker.encode()) % n_shards
+
+
+def shard_name(dataset_name, index, n_shards):
+    return f"{dataset_name}-shard{index:04d}-of-{n_shards:04d}"
+
+
+def _partition_csv_files(csv_files, n_shards):
+    partitions = [[] for _ in range(n_shards)]
+    for filename in csv_files:
+        partitions[shard_for_ticker(ticker_from_filename(filename), n_shards)].append(
+            filename
+        )
+    return partitions
+
+
+def _shard_paths(dataset_name, n_shards):
+    return [
+        f"{shard_name(dataset_name, index, n_shards)}.hdf5" for index in range(n_shards)
+    ]
+
+
+def check_shards(dataset_file):
+    """Raise if a stitched dataset's shards are missing or have changed length.
+
+    Reading a virtual dataset whose source file is gone silently returns fill
+    values, so readers call this before trusting a stitched file.
+    """
+    if "shard_rows" not in dataset_file.attrs:
+        return
+    directory = os.path.dirname(os.path.abspath(dataset_file.filename))
+    for name, rows in zip(
+        dataset_file.attrs["shard_files"], dataset_file.attrs["shard_rows"]
+    ):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"Dataset shard {path} of {dataset_file.filename} is missing"
+            )
+        with h5py.File(path, "r") as shard_file:
+            if len(shard_file["images"]) != rows:
+                raise ValueError(
+                    f"Dataset shard {path} has {len(shard_file['images'])} rows but "
+                    f"was stitched with {rows}, rerun stitch_shards"
+                )
+
+
+def stitch_shards(dataset_name, n_shards):
+    """Expose every shard of a dataset as one file through virtual datasets.
+
+    ``{dataset_name}.hdf5`` only holds references into the shard files (by
+    relative path, so the set can be moved together), along with a merged
+    journal whose row ranges are offset into the combined view. Each shard's
+    row count is recorded so check_shards can tell when one has gone missing
+    or been rebuilt since. Rerun this whenever a shard is rebuilt.
+    """
+    shard_paths = _shard_paths(dataset_name, n_shards)
+    missing = [path for path in shard_paths if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"Missing dataset shards: {', '.join(missing)}")
+
+    shard_files = [h5py.File(path, "r") for path in shard_paths]
+    try:
+        lengths = [len(shard_file["images"]) for shard_file in shard_files]
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        image_types = {shard_file.attrs["image_type"] for shard_file in shard_files}
+        if len(image_types) != 1:
+            raise ValueError(
+                f"Shards were built with different image types {image_types}"
+            )
+
+        with h5py.File(f"{dataset_name}.hdf5", "w") as dataset_file:
+            for field in FIELDS:
+                source = shard_files[0][field]
+                layout = h5py.VirtualLayout(
+                    shape=(offsets[-1], *source.shape[1:]), dtype=source.dtype
+                )
+                for shard_path, shard_file, start, end in zip(
+                    shard_paths, shard_files, offsets[:-1], offsets[1:]
+                ):
+                    if start == end:
+                        continue
+                    layout[start:end] = h5py.VirtualSource(
+                        # Shards sit next to the combined file
+                        os.path.basename(shard_path),
+                        field,
+                        shape=shard_file[field].shape,
+                    )
+                # Rows of a missing shard read as NaN rather than as zero prices
+                dataset_file.create_virtual_dataset(
+                    field,
+                    layout,
+                    fillvalue=np.nan if source.dtype.kind == "f" else None,
+                )
+
+            tickers, rows = [], []
+            for shard_file, offset in zip(shard_files, offsets):
+                for ticker, (start, end) in read_journal(shard_file).items():
+                    tickers.append(ticker)
+                    rows.append((start + offset, end + offset))
+            journal = dataset_file.create_group(JOURNAL)
+            journal.create_dataset(
+                "ticker",
+                data=np.array(tickers, dtype=object),
+                dtype=h5py.string_dtype(),
+            )
+            journal.create_dataset(
+                "rows", data=np.array(rows, dtype="int64").reshape(-1, 2)
+            )
+            dataset_file.attrs["image_type"] = image_types.pop()
+            dataset_file.attrs["shards"] = n_shards
+            dataset_file.attrs["shard_files"] = [
+                os.path.basename(path) for path in shard_paths
+            ]
+            dataset_file.attrs["shard_rows"] = lengths
+    finally:
+        for shard_file in shard_files:
+            shard_file.close()
+
+
+def create_sharded_dataset(
+    dataset_name,
+    csv_files,
+    image_type,
+    n_shards,
+    shard_indices=None,
+    processes=None,
+    quiet=False,
+    compression_rate=4,
+    resume=False,
+):
+    """Build a dataset as ``n_shards`` files split by ticker hash.
+
+    Shards are built in parallel processes, each one a regular resumable
+    dataset file. ``shard_indices`` limits the build to some of the shards so
+    they can be spread over several machines or rebuilt independently. Once
+    every shard file exists they're stitched into ``{dataset_name}.hdf5``.
+    """
+    if n_shards < 1:
+        raise ValueError(f"Need at least one shard, got {n_shards}")
+    if shard_indices is None:
+        shard_indices = range(n_shards)
+    invalid_indices = [index for index in shard_indices if not 0 <= index < n_shards]
+    if invalid_indices:
+        raise ValueError(
+            f"Shard indices {invalid_indices} are out of range for {n_shards} shards"
+        )
+    partitions = _partition_csv_files(csv_files, n_shards)
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [
+            executor.submit(
+                create_dataset,
+                shard_name(dataset_name, index, n_shards),
+                partitions[index],
+                image_type,
+                quiet=True,
+                compression_rate=compression_rate,
+                resume=resume,
+            )
+            for index in shard_indices
+        ]
+        for future in tqdm(
+            as_completed(futures),
+            total=len(futures),
+            desc="Creating dataset shards",
+            disable=quiet,
+        ):
+            future.result()
+
+    if all(os.path.exists(path) for path in _shard_paths(dataset_name, n_shards)):
+        stitch_shards(dataset_name, n_shards)
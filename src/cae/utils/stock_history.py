@@ -12,7 +12,7 @@ class MovingAverage:
         self.values = deque()
 
     def add(self, value):
-        if math.isnan:
+        if math.isnan(value):
             self._nans += 1
         else:
             self._sum += value
@@ -44,7 +44,7 @@ def _coerce_to_float_with_factor(value, factor):
     return _coerce_to_float(value) * factor
 
 
-def _coerce_time(row):
+def coerce_time(row):
     """Supports iso and YY MM DD format"""
     date_string = row.get("Date", row.get("date"))
     try:
@@ -98,6 +98,52 @@ class StockRow:
         )
 
 
+def process_row(row, moving_averages):
+    """Convert one raw csv row, updating ``moving_averages`` in place."""
+    date = coerce_time(row)
+    adjustment_factor = _calculate_adjustment_factor(row)
+    recorded_high_value = _coerce_to_float_with_factor(
+        row.get("High", row.get("high")), adjustment_factor
+    )
+    recorded_low_value = _coerce_to_float_with_factor(
+        row.get("Low", row.get("low")), adjustment_factor
+    )
+    open_value = _coerce_to_float_with_factor(
+        row.get("Open", row.get("open")), adjustment_factor
+    )
+    close_value = _coerce_to_float_with_factor(
+        row.get("Close", row.get("close")), adjustment_factor
+    )
+    volume_value = _coerce_to_float(row.get("Volume", row.get("volume")))
+
+    # Update moving averages
+    for moving_average in moving_averages.values():
+        moving_average.add(close_value)
+
+    candle_vals = (recorded_low_value, recorded_high_value, close_value, open_value)
+    # Stock data might be messy, sometimes highs really aren't highs for the
+    # so we recalculate the high and low values ourselves
+    high_value = max(
+        (val for val in candle_vals if not math.isnan(val)), default=math.nan
+    )
+    low_value = min(
+        (val for val in candle_vals if not math.isnan(val)), default=math.nan
+    )
+
+    return StockRow(
+        date=date,
+        high=high_value,
+        low=low_value,
+        close=close_value,
+        open=open_value,
+        volume=volume_value,
+        moving_averages={
+            duration: moving_average.get()
+            for duration, moving_average in moving_averages.items()
+        },
+    )
+
+
 def preprocess_rows(rows, moving_average_durations=None):
     if moving_average_durations is None:
         moving_average_durations = []
@@ -105,51 +151,4 @@ def preprocess_rows(rows, moving_average_durations=None):
     moving_averages = {
         duration: MovingAverage(duration) for duration in moving_average_durations
     }
-
-    new_rows = []
-    for row in rows:
-        date = _coerce_time(row)
-        adjustment_factor = _calculate_adjustment_factor(row)
-        recorded_high_value = _coerce_to_float_with_factor(
-            row.get("High", row.get("high")), adjustment_factor
-        )
-        recorded_low_value = _coerce_to_float_with_factor(
-            row.get("Low", row.get("low")), adjustment_factor
-        )
-        open_value = _coerce_to_float_with_factor(
-            row.get("Open", row.get("open")), adjustment_factor
-        )
-        close_value = _coerce_to_float_with_factor(
-            row.get("Close", row.get("close")), adjustment_factor
-        )
-        volume_value = _coerce_to_float(row.get("Volume", row.get("volume")))
-
-        # Update moving averages
-        for duration in moving_average_durations:
-            moving_averages[duration].add(close_value)
-
-        candle_vals = (recorded_low_value, recorded_high_value, close_value, open_value)
-        # Stock data might be messy, sometimes highs really aren't highs for the
-        # so we recalculate the high and low values ourselves
-        high_value = max(
-            (val for val in candle_vals if not math.isnan(val)), default=math.nan
-        )
-        low_value = min(
-            (val for val in candle_vals if not math.isnan(val)), default=math.nan
-        )
-
-        new_rows.append(
-            StockRow(
-                date=date,
-                high=high_value,
-                low=low_value,
-                close=close_value,
-                open=open_value,
-                volume=volume_value,
-                moving_averages={
-                    duration: moving_averages[duration].get()
-                    for duration in moving_average_durations
-                },
-            )
-        )
-    return new_rows
+    return [process_row(row, moving_averages) for row in rows]
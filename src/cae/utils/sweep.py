@@ -0,0 +1,313 @@
+from collections import deque
+import csv
+from dataclasses import asdict, dataclass, fields
+import itertools
+import math
+import os
+import queue
+import time
+
+import h5py
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from datasets.binary_horizon_prediction import journal_row_ranges, labelled_idxs
+from model.reimagining_price_trends import create_model_with_defaults
+
+
+@dataclass(frozen=True)
+class TrialConfig:
+    dataset: str
+    learning_rate: float
+    dropout: float
+    horizon: int
+
+
+@dataclass
+class TrialResult:
+    trial: int
+    dataset: str
+    learning_rate: float
+    dropout: float
+    horizon: int
+    epochs_run: int
+    stopped_early: bool
+    best_validation_loss: float
+    validation_accuracy: float
+    seconds: float
+    error: str = ""
+
+
+def grid(datasets, learning_rates, dropouts, horizons):
+    return [
+        TrialConfig(*values)
+        for values in itertools.product(datasets, learning_rates, dropouts, horizons)
+    ]
+
+
+def _read_shared_images(images, slab_rows=16384):
+    """Fill a shared uint8 tensor with the images one slab at a time.
+
+    HDF5 converts each slab straight into the shared memory, so no float32
+    copy of the images is ever held. Slabs are aligned to the chunks so each
+    compressed chunk is only read once.
+    """
+    shared = torch.empty(images.shape, dtype=torch.uint8).share_memory_()
+    destination = shared.numpy()
+    chunk_rows = images.chunks[0] if images.chunks else 1
+    slab_rows = max(chunk_rows, slab_rows // chunk_rows * chunk_rows)
+    for start in range(0, len(images), slab_rows):
+        rows = np.s_[start : start + slab_rows]
+        images.read_direct(destination, rows, rows)
+    return shared
+
+
+def load_shared_dataset(path):
+    """Read a dataset file fully into shared memory for every trial to use.
+
+    Images are binary masks so they're held as uint8, a quarter of the size of
+    the float32 images on disk.
+    """
+    with h5py.File(path, "r") as f:
+        # Checks a stitched file's shards before any of their data is read
+        row_ranges = journal_row_ranges(f)
+        return {
+            "images": _read_shared_images(f["images"]),
+            "close": torch.from_numpy(f["close"][:]).share_memory_(),
+            # Day strings sort chronologically and are only needed in the parent
+            "date": f["date"].asstr()[:].astype("U10"),
+            "row_ranges": row_ranges,
+        }
+
+
+def _split_indices(dataset, horizon, validation_fraction):
+    """Labelled rows split in time, validation gets the latest dates.
+
+    Training rows whose label comes from a close on or after the cutoff are
+    dropped, leaving a ``horizon`` day gap so no training label overlaps the
+    validation period.
+    """
+    idxs = labelled_idxs(dataset["close"].numpy(), dataset["row_ranges"], horizon)
+    dates = dataset["date"][idxs]
+    unique_dates = np.unique(dates)
+    cutoff = unique_dates[int(len(unique_dates) * (1 - validation_fraction))]
+    in_validation = dates >= cutoff
+    in_training = ~in_validation & (dataset["date"][idxs + horizon] < cutoff)
+    return idxs[in_training], idxs[in_validation]
+
+
+def _batch(images, close, idxs, horizon):
+    idxs = torch.from_numpy(idxs)
+    up = close[idxs + horizon] > close[idxs]
+    labels = torch.stack((~up, up), dim=1).float()
+    return images[idxs].float(), labels
+
+
+def _evaluate(model, loss_fn, images, close, idxs, horizon, batch_size):
+    model.eval()
+    total_loss, correct = 0.0, 0
+    with torch.no_grad():
+        for start in range(0, len(idxs), batch_size):
+            inputs, labels = _batch(
+                images, close, idxs[start : start + batch_size], horizon
+            )
+            outputs = model(inputs)
+            total_loss += loss_fn(outputs, labels).item() * len(labels)
+            correct += (outputs.argmax(1) == labels.argmax(1)).sum().item()
+    return total_loss / len(idxs), correct / len(idxs)
+
+
+def _should_stop(scores, trial, epoch, grace_epochs, min_trials):
+    """Median stopping rule against the other trials at the same epoch."""
+    if epoch < grace_epochs:
+        return False
+    column = scores[:, epoch].numpy()
+    others = np.delete(column, trial)
+    others = others[~np.isnan(others)]
+    if len(others) < min_trials:
+        return False
+    best_so_far = np.nanmin(scores[trial, : epoch + 1].numpy())
+    return best_so_far > np.median(others)
+
+
+def _rebalance_threads(thread_budget, trials, cpus):
+    """Split the cpus as evenly as possible between the running ``trials``."""
+    base, extra = divmod(cpus, max(len(trials), 1))
+    for position, trial in enumerate(sorted(trials)):
+        thread_budget[trial] = max(1, base + (position < extra))
+
+
+def _run_trial(
+    trial,
+    config,
+    dataset,
+    train_idxs,
+    validation_idxs,
+    scores,
+    results,
+    thread_budget,
+    *,
+    epochs,
+    batch_size,
+    grace_epochs,
+    min_trials,
+    seed,
+):
+    start_time = time.monotonic()
+    torch.manual_seed(seed + trial)
+    rng = np.random.default_rng(seed + trial)
+    images, close = dataset
+    result = TrialResult(
+        trial=trial,
+        **asdict(config),
+        epochs_run=0,
+        stopped_early=False,
+        best_validation_loss=math.nan,
+        validation_accuracy=math.nan,
+        seconds=math.nan,
+    )
+    try:
+        model, optimizer, loss_fn = create_model_with_defaults(
+            tuple(images.shape[1:]), lr=config.learning_rate, dropout=config.dropout
+        )
+        for epoch in range(epochs):
+            # Pick up cores freed by trials that have finished since last epoch
+            torch.set_num_threads(int(thread_budget[trial]))
+            model.train()
+            shuffled = rng.permutation(train_idxs)
+            for batch_start in range(0, len(shuffled), batch_size):
+                inputs, labels = _batch(
+                    images,
+                    close,
+                    shuffled[batch_start : batch_start + batch_size],
+                    config.horizon,
+                )
+                loss = loss_fn(model(inputs), labels)
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+
+            validation_loss, validation_accuracy = _evaluate(
+                model,
+                loss_fn,
+                images,
+                close,
+                validation_idxs,
+                config.horizon,
+                batch_size,
+            )
+            scores[trial, epoch] = validation_loss
+            result.epochs_run = epoch + 1
+            if not validation_loss >= result.best_validation_loss:
+                result.best_validation_loss = validation_loss
+                result.validation_accuracy = validation_accuracy
+            if _should_stop(scores, trial, epoch, grace_epochs, min_trials):
+                result.stopped_early = True
+                break
+    except Exception as e:
+        result.error = repr(e)
+    result.seconds = time.monotonic() - start_time
+    results.put(result)
+
+
+def _write_results(results, output_path):
+    with open(output_path, "w") as output_file:
+        writer = csv.DictWriter(output_file, [f.name for f in fields(TrialResult)])
+        writer.writeheader()
+        writer.writerows(asdict(result) for result in results)
+
+
+def run_sweep(
+    configs,
+    output_path,
+    *,
+    epochs=10,
+    batch_size=128,
+    max_concurrent=None,
+    validation_fraction=0.2,
+    grace_epochs=1,
+    min_trials=2,
+    seed=0,
+):
+    """Train every config concurrently against datasets loaded only once.
+
+    Each dataset file is read into shared memory in this process and every
+    trial process trains on those same tensors. Trials are started as slots
+    free up and the CPU cores are split evenly between the running trials.
+    The split is redone whenever a trial starts or finishes and every trial
+    applies its share at the start of each epoch, so the last few trials
+    take over the cores of the ones that are done.
+    After ``grace_epochs`` a trial stops once its best validation loss is
+    worse than the median of the other trials at the same epoch.
+    """
+    cpus = os.cpu_count() or 1
+    max_concurrent = min(max_concurrent or cpus, len(configs))
+    datasets = {
+        path: load_shared_dataset(path) for path in {c.dataset for c in configs}
+    }
+    splits = {
+        (c.dataset, c.horizon): _split_indices(
+            datasets[c.dataset], c.horizon, validation_fraction
+        )
+        for c in configs
+    }
+    scores = torch.full((len(configs), epochs), math.nan).share_memory_()
+    thread_budget = torch.ones(len(configs), dtype=torch.int32).share_memory_()
+
+    context = mp.get_context()
+    results_queue = context.Queue()
+    pending = deque(enumerate(configs))
+    running = {}
+    results = []
+    while pending or running:
+        while pending and len(running) < max_concurrent:
+            trial, config = pending.popleft()
+            _rebalance_threads(thread_budget, [*running, trial], cpus)
+            process = context.Process(
+                target=_run_trial,
+                args=(
+                    trial,
+                    config,
+                    (
+                        datasets[config.dataset]["images"],
+                        datasets[config.dataset]["close"],
+                    ),
+                    *splits[(config.dataset, config.horizon)],
+                    scores,
+                    results_queue,
+                    thread_budget,
+                ),
+                kwargs={
+                    "epochs": epochs,
+                    "batch_size": batch_size,
+                    "grace_epochs": grace_epochs,
+                    "min_trials": min_trials,
+                    "seed": seed,
+                },
+            )
+            process.start()
+            running[trial] = process
+
+        try:
+            result = results_queue.get(timeout=1)
+        except queue.Empty:
+            # Catch trials that died without reporting, e.g. killed for memory
+            for trial, process in list(running.items()):
+                if not process.is_alive() and process.exitcode != 0:
+                    print(f"Trial {trial} exited with code {process.exitcode}")
+                    del running[trial]
+                    _rebalance_threads(thread_budget, running, cpus)
+            continue
+        running.pop(result.trial).join()
+        _rebalance_threads(thread_budget, running, cpus)
+        results.append(result)
+        print(
+            f"Trial {result.trial} finished after {result.epochs_run} epochs, "
+            f"validation loss {result.best_validation_loss:.4f}"
+            + (" (stopped early)" if result.stopped_early else "")
+            + (f" error {result.error}" if result.error else "")
+        )
+
+    results.sort(key=lambda result: result.trial)
+    _write_results(results, output_path)
+    return results
@@ -0,0 +1,15 @@
+import torch
+from cae.model.chart_auto_encoder import create_auto_encoder_with_defaults
+
+
+def test_reconstruction_matches_input_shape():
+    model, _, loss_fn = create_auto_encoder_with_defaults((3, 32, 15), embedding_size=8)
+    images = (torch.rand(4, 3, 32, 15) > 0.5).float()
+
+    embeddings = model.encode(images)
+    reconstructed = model.decode(embeddings)
+
+    assert embeddings.shape == (4, 8)
+    assert reconstructed.shape == images.shape
+    # The sigmoid output is a valid input to the binary cross entropy loss
+    assert torch.isfinite(loss_fn(model(images), images))
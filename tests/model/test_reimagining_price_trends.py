@@ -0,0 +1,15 @@
+import torch
+import torch.nn as nn
+from cae.model.reimagining_price_trends import create_model_with_defaults
+
+
+def test_default_loss_takes_the_softmax_probabilities():
+    model, _, loss_fn = create_model_with_defaults((3, 32, 15))
+    outputs = model(torch.rand(4, 3, 32, 15))
+
+    torch.testing.assert_close(outputs.sum(dim=1), torch.ones(4))
+    assert isinstance(loss_fn, nn.BCELoss)
+    labels = torch.tensor([[0.0, 1.0]] * 4)
+    torch.testing.assert_close(
+        loss_fn(outputs, labels), -torch.log(outputs[:, 1]).mean()
+    )
@@ -0,0 +1,49 @@
+import csv
+import datetime
+
+import numpy as np
+import pytest
+
+SAMPLE_TICKERS = ["AAA", "BBB", "CCC"]
+SAMPLE_DAYS = 20
+
+
+def _write_csv(path, seed):
+    rng = np.random.default_rng(seed)
+    price = 100.0
+    date = datetime.date(2020, 1, 1)
+    with open(path, "w") as csv_file:
+        writer = csv.DictWriter(
+            csv_file, ["Date", "Open", "High", "Low", "Close", "Adj Close", "Volume"]
+        )
+        writer.writeheader()
+        for _ in range(SAMPLE_DAYS):
+            close = price * (1 + rng.normal(0, 0.02))
+            writer.writerow(
+                {
+                    "Date": date.isoformat(),
+                    "Open": price,
+                    "High": max(price, close) * 1.01,
+                    "Low": min(price, close) * 0.99,
+                    "Close": close,
+                    "Adj Close": close,
+                    "Volume": rng.integers(1000, 5000),
+                }
+            )
+            price = close
+            date += datetime.timedelta(days=1)
+
+
+@pytest.fixture
+def sample_days():
+    return SAMPLE_DAYS
+
+
+@pytest.fixture
+def csv_files(tmp_path):
+    paths = []
+    for seed, ticker in enumerate(SAMPLE_TICKERS):
+        path = tmp_path / f"{ticker}.csv"
+        _write_csv(path, seed)
+        paths.append(str(path))
+    return paths
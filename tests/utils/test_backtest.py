@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from cae.utils.backtest import (
+    assign_deciles,
+    backtest,
+    build_panel,
+    forward_returns,
+)
+
+
+def _panel(close, probability, volume=None):
+    n_dates, n_tickers = close.shape
+    dates = np.repeat(
+        (np.datetime64("2020-01-01") + np.arange(n_dates)).astype(str), n_tickers
+    )
+    tickers = np.tile([f"T{i:03d}" for i in range(n_tickers)], n_dates)
+    volume = np.ones_like(close) if volume is None else volume
+    return build_panel(
+        tickers, dates, close.ravel(), volume.ravel(), probability.ravel()
+    )
+
+
+def test_forward_returns():
+    close = np.array([[1.0], [2.0], [4.0]])
+    np.testing.assert_array_equal(forward_returns(close, 1)[:, 0], [1.0, 1.0, np.nan])
+
+
+def test_assign_deciles_ignores_missing_scores():
+    scores = np.array([[0.9, np.nan, 0.1, 0.5, 0.3]])
+    np.testing.assert_array_equal(assign_deciles(scores, 2), [[1, -1, 0, 1, 0]])
+
+
+def test_perfect_predictions_earn_long_short_spread():
+    rng = np.random.default_rng(0)
+    close = np.cumprod(1 + rng.normal(0, 0.02, size=(100, 50)), axis=0)
+    # A perfect forecaster knows the next day's return
+    probability = forward_returns(close, 1)
+    result = backtest(_panel(close, probability), horizon=1, n_deciles=5)
+
+    assert len(result.dates) == 99
+    assert np.all(result.long_short_returns > 0)
+    assert np.all(np.diff(np.nanmean(result.decile_returns, axis=0)) > 0)
+    assert result.long_short_sharpe > 0
+    assert 0 <= result.mean_turnover <= 1
+
+
+def test_volume_weighting():
+    close = np.array([[1.0, 1.0], [2.0, 1.5]])
+    probability = np.array([[0.6, 0.6], [np.nan, np.nan]])
+    volume = np.array([[3.0, 1.0], [1.0, 1.0]])
+    panel = _panel(close, probability, volume)
+
+    equal = backtest(panel, horizon=1, n_deciles=1)
+    weighted = backtest(panel, horizon=1, n_deciles=1, weighting="volume")
+    assert equal.decile_returns[0, 0] == pytest.approx(0.75)
+    assert weighted.decile_returns[0, 0] == pytest.approx(0.875)
+
+
+def test_turnover_of_unchanged_portfolio_is_zero():
+    close = np.ones((10, 20))
+    probability = np.tile(np.linspace(0, 1, 20), (10, 1))
+    result = backtest(_panel(close, probability), horizon=2)
+    np.testing.assert_allclose(result.turnover[1:], 0)
@@ -0,0 +1,64 @@
+import h5py
+import numpy as np
+import torch
+from cae.model.chart_auto_encoder import ChartAutoEncoder
+from cae.utils.embeddings import export_embeddings, load_embeddings
+from cae.utils.images import ImageType, create_dataset
+from cae.utils.shards import create_sharded_dataset
+
+
+def test_export_embeddings_aligns_rows(tmp_path, csv_files):
+    create_dataset(tmp_path / "dataset", csv_files, ImageType.D5, quiet=True)
+    torch.manual_seed(0)
+    model = ChartAutoEncoder((3, 32, 15), embedding_size=8)
+
+    # A batch size that doesn't divide the row count exercises the last batch
+    export_embeddings(
+        model,
+        tmp_path / "dataset.hdf5",
+        tmp_path / "embeddings.hdf5",
+        batch_size=7,
+        quiet=True,
+    )
+
+    embeddings = load_embeddings(tmp_path / "embeddings.hdf5")
+    with h5py.File(tmp_path / "dataset.hdf5", "r") as dataset_file, h5py.File(
+        tmp_path / "embeddings.hdf5", "r"
+    ) as embeddings_file:
+        images = torch.from_numpy(dataset_file["images"][:]).float()
+        for field in ["ticker", "date"]:
+            np.testing.assert_array_equal(
+                embeddings_file[field].asstr()[:], dataset_file[field].asstr()[:]
+            )
+
+    assert embeddings.shape == (len(images), 8)
+    with torch.no_grad():
+        expected = model.eval().encode(images).numpy()
+    np.testing.assert_allclose(embeddings, expected, rtol=1e-4, atol=1e-5)
+
+
+def test_export_from_stitched_dataset_writes_real_fields(tmp_path, csv_files):
+    (tmp_path / "shards").mkdir()
+    (tmp_path / "out").mkdir()
+    create_sharded_dataset(
+        tmp_path / "shards" / "sharded", csv_files, ImageType.D5, n_shards=2, quiet=True
+    )
+
+    export_embeddings(
+        ChartAutoEncoder((3, 32, 15), embedding_size=8),
+        tmp_path / "shards" / "sharded.hdf5",
+        tmp_path / "out" / "embeddings.hdf5",
+        quiet=True,
+    )
+
+    with h5py.File(
+        tmp_path / "shards" / "sharded.hdf5", "r"
+    ) as dataset_file, h5py.File(
+        tmp_path / "out" / "embeddings.hdf5", "r"
+    ) as embeddings_file:
+        for field in ["ticker", "date"]:
+            assert not embeddings_file[field].is_virtual
+            np.testing.assert_array_equal(
+                embeddings_file[field].asstr()[:], dataset_file[field].asstr()[:]
+            )
+        assert set(embeddings_file["ticker"].asstr()[:]) == {"AAA", "BBB", "CCC"}
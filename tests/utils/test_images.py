@@ -0,0 +1,149 @@
+import os
+import signal
+import subprocess
+import sys
+
+import h5py
+import numpy as np
+import pytest
+from cae.utils import images
+from cae.utils.images import (
+    FIELDS,
+    ImageType,
+    create_dataset,
+    read_journal,
+    ticker_from_filename,
+)
+
+
+def _read_fields(path):
+    with h5py.File(path, "r") as dataset_file:
+        return {field: dataset_file[field][:] for field in FIELDS}
+
+
+def test_create_dataset_journals_every_ticker(tmp_path, csv_files, sample_days):
+    create_dataset(tmp_path / "dataset", csv_files, ImageType.D5, quiet=True)
+    rows_per_ticker = sample_days - ImageType.D5.candles
+
+    with h5py.File(tmp_path / "dataset.hdf5", "r") as dataset_file:
+        assert dataset_file["images"].shape == (3 * rows_per_ticker, 3, 32, 15)
+        assert read_journal(dataset_file) == {
+            ticker: (i * rows_per_ticker, (i + 1) * rows_per_ticker)
+            for i, ticker in enumerate(map(ticker_from_filename, csv_files))
+        }
+
+
+def test_resume_skips_committed_tickers_and_truncates_tail(
+    tmp_path, csv_files, monkeypatch
+):
+    create_dataset(tmp_path / "expected", csv_files, ImageType.D5, quiet=True)
+
+    # Die while writing the third ticker, after its images were appended
+    original_append = images._append_to_hdf5_dataset
+
+    def failing_append(h5_file, field, data):
+        original_append(h5_file, field, data)
+        if field == "images" and h5_file["images"].shape[0] > 2 * len(data):
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(images, "_append_to_hdf5_dataset", failing_append)
+    with pytest.raises(KeyboardInterrupt):
+        create_dataset(tmp_path / "dataset", csv_files, ImageType.D5, quiet=True)
+    monkeypatch.undo()
+
+    processed = []
+    original_process = images._process_images_and_rows
+
+    def recording_process(*args, **kwargs):
+        processed.append(args[0][0]["Date"])
+        return original_process(*args, **kwargs)
+
+    monkeypatch.setattr(images, "_process_images_and_rows", recording_process)
+    create_dataset(
+        tmp_path / "dataset", csv_files, ImageType.D5, quiet=True, resume=True
+    )
+
+    assert len(processed) == 1
+    expected = _read_fields(tmp_path / "expected.hdf5")
+    actual = _read_fields(tmp_path / "dataset.hdf5")
+    for field in FIELDS:
+        np.testing.assert_array_equal(actual[field], expected[field])
+
+
+# Builds a dataset in a child process that SIGKILLs itself while appending the
+# third ticker, so nothing gets the chance to close or flush the file
+KILLED_BUILD = """
+import os, signal, sys
+from utils import images
+
+original_append = images._append_to_hdf5_dataset
+
+def dying_append(h5_file, field, data):
+    original_append(h5_file, field, data)
+    if field == "images" and h5_file["images"].shape[0] > 2 * len(data):
+        os.kill(os.getpid(), signal.SIGKILL)
+
+images._append_to_hdf5_dataset = dying_append
+images.create_dataset(sys.argv[1], sys.argv[2:], images.ImageType.D5, quiet=True)
+"""
+
+
+def _corrupt_boundary_chunks(path):
+    """Garble the chunks holding the last committed rows, as a torn write would."""
+    with h5py.File(path, "r") as dataset_file:
+        committed_rows = max(end for _, end in read_journal(dataset_file).values())
+        extents = []
+        for field in FIELDS:
+            dset = dataset_file[field]
+            boundary = committed_rows - committed_rows % dset.chunks[0]
+            for index in range(dset.id.get_num_chunks()):
+                info = dset.id.get_chunk_info(index)
+                if info.chunk_offset[0] == boundary:
+                    extents.append((info.byte_offset, info.size))
+    assert extents
+    with open(path, "r+b") as raw_file:
+        for offset, size in extents:
+            raw_file.seek(offset)
+            raw_file.write(b"\xff" * size)
+
+
+def test_resume_after_hard_kill_restores_boundary_chunks(tmp_path, csv_files):
+    create_dataset(tmp_path / "expected", csv_files, ImageType.D5, quiet=True)
+
+    build = subprocess.run(
+        [sys.executable, "-c", KILLED_BUILD, str(tmp_path / "dataset"), *csv_files],
+        env={
+            **os.environ,
+            "PYTHONPATH": os.path.dirname(os.path.dirname(images.__file__)),
+        },
+    )
+    assert build.returncode == -signal.SIGKILL
+    _corrupt_boundary_chunks(tmp_path / "dataset.hdf5")
+
+    create_dataset(
+        tmp_path / "dataset", csv_files, ImageType.D5, quiet=True, resume=True
+    )
+
+    expected = _read_fields(tmp_path / "expected.hdf5")
+    actual = _read_fields(tmp_path / "dataset.hdf5")
+    for field in FIELDS:
+        np.testing.assert_array_equal(actual[field], expected[field])
+    with h5py.File(tmp_path / "dataset.hdf5", "r") as dataset_file:
+        assert list(read_journal(dataset_file)) == list(
+            map(ticker_from_filename, csv_files)
+        )
+    assert not (tmp_path / "dataset.hdf5.boundary").exists()
+
+
+def test_resume_with_different_image_type_rebuilds(tmp_path, csv_files):
+    create_dataset(tmp_path / "dataset", csv_files[:1], ImageType.D5, quiet=True)
+    with h5py.File(tmp_path / "dataset.hdf5", "a") as dataset_file:
+        dataset_file.attrs["image_type"] = "OTHER"
+
+    create_dataset(
+        tmp_path / "dataset", csv_files, ImageType.D5, quiet=True, resume=True
+    )
+    with h5py.File(tmp_path / "dataset.hdf5", "r") as dataset_file:
+        assert list(read_journal(dataset_file)) == list(
+            map(ticker_from_filename, csv_files)
+        )
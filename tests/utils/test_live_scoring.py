@@ -0,0 +1,51 @@
+import csv
+
+import h5py
+import numpy as np
+from cae.utils.images import ImageType, create_dataset
+from cae.utils.live_scoring import LiveImageEngine
+
+
+def _read_rows(path):
+    with open(path, "r") as csv_file:
+        return list(csv.DictReader(csv_file))
+
+
+def test_incremental_images_match_dataset(tmp_path, csv_files):
+    create_dataset(tmp_path / "dataset", csv_files[:1], ImageType.D5, quiet=True)
+    with h5py.File(tmp_path / "dataset.hdf5", "r") as dataset_file:
+        expected = dataset_file["images"][:]
+
+    rows = _read_rows(csv_files[0])
+    engine = LiveImageEngine(ImageType.D5)
+    images = [engine.add_bar("AAA", row) for row in rows]
+    # The dataset doesn't render an image for the final row
+    rendered = np.stack([image for image in images if image is not None][:-1])
+    np.testing.assert_allclose(rendered, expected)
+
+
+def test_warm_up_from_tail_matches_full_history(tmp_path, csv_files):
+    rows = _read_rows(csv_files[0])
+    full = LiveImageEngine(ImageType.D5)
+    for row in rows[:-1]:
+        full.add_bar("AAA", row)
+    tail = LiveImageEngine(ImageType.D5)
+    tail.warm_up("AAA", rows[:-1])
+
+    np.testing.assert_array_equal(
+        tail.add_bar("AAA", rows[-1]), full.add_bar("AAA", rows[-1])
+    )
+
+
+def test_state_round_trip_and_repeated_bars(tmp_path, csv_files):
+    rows = _read_rows(csv_files[0])
+    engine = LiveImageEngine(ImageType.D5)
+    engine.warm_up("AAA", rows[:-1])
+    engine.save(tmp_path / "state.json")
+
+    loaded = LiveImageEngine.load(tmp_path / "state.json")
+    scores = loaded.score({"AAA": rows[-1]}, lambda images: images.sum(axis=(1, 2, 3)))
+    assert list(scores) == ["AAA"]
+    np.testing.assert_array_equal(scores["AAA"], engine.add_bar("AAA", rows[-1]).sum())
+    # Rerunning the same day doesn't add the bar twice
+    assert loaded.score({"AAA": rows[-1]}, lambda images: images) == {}
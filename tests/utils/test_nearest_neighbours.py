@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from cae.utils.nearest_neighbours import (
+    BruteForceIndex,
+    IVFPQIndex,
+    build_index,
+    load_index,
+)
+
+
+@pytest.fixture
+def embeddings():
+    rng = np.random.default_rng(0)
+    # Clustered data so the approximate index has structure to exploit
+    centers = rng.normal(size=(16, 16)) * 5
+    return (
+        centers[rng.integers(0, 16, size=4000)] + rng.normal(size=(4000, 16))
+    ).astype(np.float32)
+
+
+def test_brute_force_matches_exhaustive_search(embeddings):
+    queries = embeddings[:5] + 0.01
+    index = BruteForceIndex(embeddings, block_size=333)
+    distances, indices = index.search(queries, k=7)
+
+    expected = np.argsort(((queries[:, None] - embeddings[None]) ** 2).sum(2), axis=1)
+    np.testing.assert_array_equal(indices, expected[:, :7])
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+
+def test_brute_force_k_larger_than_index():
+    index = BruteForceIndex(np.eye(3, dtype=np.float32), block_size=2)
+    distances, indices = index.search(np.eye(3)[0], k=5)
+    assert indices.shape == (1, 3)
+    assert indices[0, 0] == 0
+
+
+def test_ivfpq_recalls_exact_neighbours(embeddings):
+    index = IVFPQIndex(n_lists=16, n_subquantizers=4, n_probe=4).train(embeddings)
+    index.add(embeddings)
+    _, indices = index.search(embeddings[:20], k=10)
+    _, exact = BruteForceIndex(embeddings).search(embeddings[:20], k=10)
+
+    recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(indices, exact)])
+    assert recall > 0.5
+    assert np.all(indices[:, 0] == np.arange(20))
+
+
+def test_ivfpq_requires_training(embeddings):
+    with pytest.raises(RuntimeError):
+        IVFPQIndex(n_lists=16, n_subquantizers=4).add(embeddings)
+
+
+@pytest.mark.parametrize(
+    "kind, kwargs",
+    [
+        ("brute_force", {}),
+        ("ivfpq", {"n_lists": 8, "n_subquantizers": 4, "n_probe": 8}),
+    ],
+)
+def test_save_and_load_round_trip(embeddings, tmp_path, kind, kwargs):
+    index = build_index(embeddings, kind, **kwargs)
+    path = tmp_path / "index.npz"
+    index.save(path)
+    loaded = load_index(path)
+
+    assert type(loaded) is type(index)
+    np.testing.assert_array_equal(
+        loaded.search(embeddings[:3], k=5)[1], index.search(embeddings[:3], k=5)[1]
+    )
@@ -0,0 +1,113 @@
+import h5py
+import numpy as np
+import pytest
+from cae.datasets.binary_horizon_prediction import BinaryHorizonPredictionDataset
+from cae.utils.images import FIELDS, ImageType, create_dataset, read_journal
+from cae.utils import repack as repack_module
+from cae.utils.repack import repack
+from cae.utils.sweep import load_shared_dataset
+
+
+@pytest.fixture
+def dataset_path(tmp_path, csv_files):
+    create_dataset(tmp_path / "dataset", csv_files[::-1], ImageType.D5, quiet=True)
+    return tmp_path / "dataset.hdf5"
+
+
+def _read_fields(path):
+    with h5py.File(path, "r") as dataset_file:
+        return {field: dataset_file[field][:] for field in FIELDS}
+
+
+@pytest.mark.parametrize("order", ["ticker", "date"])
+def test_repack_sorts_rows(tmp_path, dataset_path, order):
+    repack(
+        dataset_path,
+        tmp_path / "repacked.hdf5",
+        order=order,
+        block_rows=7,
+        quiet=True,
+    )
+    source = _read_fields(dataset_path)
+    repacked = _read_fields(tmp_path / "repacked.hdf5")
+
+    keys = (
+        (source["date"], source["ticker"])
+        if order == "ticker"
+        else (source["ticker"], source["date"])
+    )
+    permutation = np.lexsort(keys)
+    for field in FIELDS:
+        np.testing.assert_array_equal(repacked[field], source[field][permutation])
+
+
+def test_repack_by_ticker_rebuilds_journal(tmp_path, dataset_path):
+    repack(dataset_path, tmp_path / "repacked.hdf5", order="ticker", quiet=True)
+    with h5py.File(tmp_path / "repacked.hdf5", "r") as repacked_file:
+        journal = read_journal(repacked_file)
+        assert list(journal) == ["AAA", "BBB", "CCC"]
+        for ticker, (start, end) in journal.items():
+            assert set(repacked_file["ticker"].asstr()[start:end]) == {ticker}
+
+    assert len(BinaryHorizonPredictionDataset(tmp_path / "repacked.hdf5")) == len(
+        BinaryHorizonPredictionDataset(dataset_path)
+    )
+
+
+def test_date_sorted_dataset_cannot_be_labelled(tmp_path, dataset_path):
+    repack(dataset_path, tmp_path / "repacked.hdf5", order="date", quiet=True)
+    with pytest.raises(ValueError, match="sorted by date"):
+        BinaryHorizonPredictionDataset(tmp_path / "repacked.hdf5")
+    # The sweep reads the labels through the same row ranges
+    with pytest.raises(ValueError, match="sorted by date"):
+        load_shared_dataset(tmp_path / "repacked.hdf5")
+
+
+def test_repack_changes_layout_and_dtype(tmp_path, dataset_path):
+    repack(
+        dataset_path,
+        tmp_path / "repacked.hdf5",
+        chunk_rows=8,
+        compression="lzf",
+        image_dtype="uint8",
+        quiet=True,
+    )
+    with h5py.File(tmp_path / "repacked.hdf5", "r") as repacked_file:
+        images = repacked_file["images"]
+        assert images.dtype == np.uint8
+        assert images.chunks == (8, 3, 32, 15)
+        assert images.compression == "lzf"
+        assert repacked_file.attrs["image_type"] == "D5"
+        with h5py.File(dataset_path, "r") as source_file:
+            np.testing.assert_array_equal(images[:], source_file["images"][:])
+
+
+def test_repack_refuses_lossy_image_dtype(tmp_path, dataset_path):
+    with h5py.File(dataset_path, "a") as dataset_file:
+        dataset_file["images"][0, 0, 0, 0] = 0.5
+
+    with pytest.raises(ValueError):
+        repack(
+            dataset_path, tmp_path / "repacked.hdf5", image_dtype="uint8", quiet=True
+        )
+    assert not (tmp_path / "repacked.hdf5").exists()
+
+
+@pytest.mark.parametrize("order", [None, "ticker"])
+def test_repack_detects_rows_that_differ_from_source(
+    tmp_path, dataset_path, monkeypatch, order
+):
+    original_blocks = repack_module._blocks_in_output_order
+
+    def swapping_blocks(source, *args):
+        for block in original_blocks(source, *args):
+            if source.ndim > 1:
+                # Swap two images, leaving their tickers and dates in place
+                block = block.copy()
+                block[[0, 1]] = block[[1, 0]]
+            yield block
+
+    monkeypatch.setattr(repack_module, "_blocks_in_output_order", swapping_blocks)
+    with pytest.raises(ValueError, match="images"):
+        repack(dataset_path, tmp_path / "repacked.hdf5", order=order, quiet=True)
+    assert not (tmp_path / "repacked.hdf5").exists()
@@ -0,0 +1,168 @@
+from contextlib import contextmanager
+import csv
+from http.client import HTTPConnection
+import json
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import numpy as np
+import pytest
+from cae.model.reimagining_price_trends import RIPTModel
+from cae.utils import scoring_server
+from cae.utils.images import ImageType
+from cae.utils.scoring_server import (
+    MicroBatcher,
+    ScoringService,
+    create_server,
+    model_predictor,
+)
+
+
+@pytest.fixture
+def recording_batcher():
+    batch_sizes = []
+
+    def predict(images):
+        batch_sizes.append(len(images))
+        return [float(image.sum()) for image in images]
+
+    batcher = MicroBatcher(predict, max_batch_size=4, max_wait=0.2).start()
+    yield batcher, batch_sizes
+    batcher.stop()
+
+
+def test_micro_batcher_coalesces_requests(recording_batcher):
+    batcher, batch_sizes = recording_batcher
+    futures = [batcher.submit(np.full((2, 2), i)) for i in range(10)]
+
+    assert [future.result(timeout=5) for future in futures] == [
+        4.0 * i for i in range(10)
+    ]
+    assert batch_sizes == [4, 4, 2]
+    assert batcher.metrics.snapshot()["batch_size_max"] == 4
+
+
+def test_micro_batcher_propagates_errors():
+    def predict(images):
+        raise RuntimeError("boom")
+
+    batcher = MicroBatcher(predict, max_wait=0).start()
+    try:
+        with pytest.raises(RuntimeError):
+            batcher.submit(np.zeros(1)).result(timeout=5)
+    finally:
+        batcher.stop()
+
+
+def _post(url, body):
+    request = Request(
+        url,
+        data=json.dumps(body).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urlopen(request) as response:
+        return json.loads(response.read())
+
+
+@contextmanager
+def _serving(service):
+    server = create_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.batcher.stop()
+
+
+def _post_error(url, body):
+    with pytest.raises(HTTPError) as error:
+        _post(url, body)
+    return error.value.code, json.loads(error.value.read())
+
+
+def _read_rows(path):
+    with open(path) as csv_file:
+        return list(csv.DictReader(csv_file))[-10:]
+
+
+def test_server_scores_tickers_and_rows(csv_files, tmp_path):
+    image_type = ImageType.D5
+    model = RIPTModel((3, image_type.pixel_height, 3 * image_type.candles))
+    batcher = MicroBatcher(model_predictor(model), max_wait=0).start()
+    service = ScoringService(batcher, image_type, source=str(tmp_path))
+    with _serving(service) as url:
+        by_ticker = _post(f"{url}/score", {"ticker": "AAA"})
+        by_rows = _post(f"{url}/score", {"rows": _read_rows(tmp_path / "AAA.csv")})
+
+        assert by_ticker == by_rows
+        assert 0 <= by_ticker["probability_up"] <= 1
+        with urlopen(f"{url}/metrics") as response:
+            assert json.loads(response.read())["requests"] == 2
+
+
+def test_server_rejects_malformed_requests():
+    batcher = MicroBatcher(lambda images: [0.5] * len(images), max_wait=0).start()
+    with _serving(ScoringService(batcher, ImageType.D5)) as url:
+        assert _post_error(f"{url}/score", {"rows": [{}] * 10})[0] == 400
+        assert _post_error(f"{url}/score", {"rows": [1] * 10})[0] == 400
+        assert _post_error(f"{url}/score", [])[0] == 400
+
+        connection = HTTPConnection(*url[len("http://") :].split(":"))
+        connection.putrequest("POST", "/score")
+        connection.endheaders()
+        assert connection.getresponse().status == 400
+        connection.close()
+
+
+def test_server_reports_model_failures_and_timeouts(csv_files):
+    rows = _read_rows(csv_files[0])
+
+    def failing_predict(images):
+        raise RuntimeError("boom")
+
+    batcher = MicroBatcher(failing_predict, max_wait=0).start()
+    with _serving(ScoringService(batcher, ImageType.D5)) as url:
+        status, body = _post_error(f"{url}/score", {"rows": rows})
+        assert status == 500
+        assert "boom" in body["error"]
+
+    def slow_predict(images):
+        time.sleep(0.5)
+        return [0.5] * len(images)
+
+    batcher = MicroBatcher(slow_predict, max_wait=0).start()
+    with _serving(ScoringService(batcher, ImageType.D5, timeout=0.01)) as url:
+        assert _post_error(f"{url}/score", {"rows": rows})[0] == 503
+
+
+def test_ticker_history_is_only_parsed_again_once_it_changes(
+    csv_files, tmp_path, monkeypatch
+):
+    reads = []
+    original_read_tail = scoring_server._read_tail
+
+    def counting_read_tail(path, rows):
+        reads.append(path)
+        return original_read_tail(path, rows)
+
+    monkeypatch.setattr(scoring_server, "_read_tail", counting_read_tail)
+    batcher = MicroBatcher(lambda images: [0.5] * len(images), max_wait=0).start()
+    service = ScoringService(batcher, ImageType.D5, source=str(tmp_path))
+    try:
+        first = service.score({"ticker": "AAA"})
+        assert service.score({"ticker": "AAA"}) == first
+        assert len(reads) == 1
+
+        rows = _read_rows(tmp_path / "AAA.csv")
+        with open(tmp_path / "AAA.csv", "a", newline="") as csv_file:
+            writer = csv.DictWriter(csv_file, list(rows[-1]))
+            writer.writerow({**rows[-1], "Date": "2021-01-01"})
+        assert service.score({"ticker": "AAA"})["date"] == "2021-01-01"
+        assert len(reads) == 2
+    finally:
+        batcher.stop()
@@ -0,0 +1,114 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+from cae.datasets.binary_horizon_prediction import BinaryHorizonPredictionDataset
+from cae.utils.images import (
+    FIELDS,
+    ImageType,
+    create_dataset,
+    read_journal,
+    ticker_from_filename,
+)
+from cae.utils.shards import create_sharded_dataset, shard_for_ticker, shard_name
+
+
+def _rows_by_ticker(path):
+    with h5py.File(path, "r") as dataset_file:
+        fields = {field: dataset_file[field][:] for field in FIELDS}
+        return {
+            ticker: {field: values[start:end] for field, values in fields.items()}
+            for ticker, (start, end) in read_journal(dataset_file).items()
+        }
+
+
+def test_shard_assignment_is_stable():
+    assert shard_for_ticker("AAPL", 8) == shard_for_ticker("AAPL", 8)
+    assert 0 <= shard_for_ticker("AAPL", 8) < 8
+
+
+def test_sharded_dataset_matches_single_file(tmp_path, csv_files):
+    create_dataset(tmp_path / "single", csv_files, ImageType.D5, quiet=True)
+    create_sharded_dataset(
+        tmp_path / "sharded", csv_files, ImageType.D5, n_shards=2, quiet=True
+    )
+
+    single = _rows_by_ticker(tmp_path / "single.hdf5")
+    sharded = _rows_by_ticker(tmp_path / "sharded.hdf5")
+    assert single.keys() == sharded.keys()
+    for ticker, fields in single.items():
+        for field, values in fields.items():
+            np.testing.assert_array_equal(sharded[ticker][field], values)
+
+    assert len(BinaryHorizonPredictionDataset(tmp_path / "sharded.hdf5")) == len(
+        BinaryHorizonPredictionDataset(tmp_path / "single.hdf5")
+    )
+
+
+def test_rebuilding_one_shard_restitches(tmp_path, csv_files):
+    create_sharded_dataset(
+        tmp_path / "sharded", csv_files, ImageType.D5, n_shards=2, quiet=True
+    )
+    before = _rows_by_ticker(tmp_path / "sharded.hdf5")
+    os.remove(f"{shard_name(tmp_path / 'sharded', 1, 2)}.hdf5")
+
+    create_sharded_dataset(
+        tmp_path / "sharded",
+        csv_files,
+        ImageType.D5,
+        n_shards=2,
+        shard_indices=[1],
+        quiet=True,
+    )
+    after = _rows_by_ticker(tmp_path / "sharded.hdf5")
+    assert before.keys() == after.keys()
+    for ticker, fields in before.items():
+        np.testing.assert_array_equal(after[ticker]["images"], fields["images"])
+
+
+def test_out_of_range_shard_index_builds_nothing(tmp_path, csv_files):
+    with pytest.raises(ValueError):
+        create_sharded_dataset(
+            tmp_path / "sharded",
+            csv_files,
+            ImageType.D5,
+            n_shards=2,
+            shard_indices=[0, 2],
+            quiet=True,
+        )
+    assert list(tmp_path.glob("sharded*")) == []
+
+
+def test_missing_shard_is_reported_not_read_as_zeros(tmp_path, csv_files):
+    create_sharded_dataset(
+        tmp_path / "sharded", csv_files, ImageType.D5, n_shards=2, quiet=True
+    )
+    moved = tmp_path / "moved.hdf5"
+    os.rename(f"{shard_name(tmp_path / 'sharded', 1, 2)}.hdf5", moved)
+
+    with h5py.File(tmp_path / "sharded.hdf5", "r") as dataset_file:
+        start, end = dataset_file.attrs["shard_rows"][0], len(dataset_file["close"])
+        assert np.isnan(dataset_file["close"][start:end]).all()
+    with pytest.raises(FileNotFoundError):
+        BinaryHorizonPredictionDataset(tmp_path / "sharded.hdf5")
+
+
+def test_shard_rebuilt_without_restitching_is_reported(tmp_path, csv_files):
+    create_sharded_dataset(
+        tmp_path / "sharded", csv_files, ImageType.D5, n_shards=2, quiet=True
+    )
+    shard_files = [
+        filename
+        for filename in csv_files
+        if shard_for_ticker(ticker_from_filename(filename), 2) == 1
+    ]
+    create_dataset(
+        shard_name(tmp_path / "sharded", 1, 2),
+        shard_files[:-1],
+        ImageType.D5,
+        quiet=True,
+    )
+
+    with pytest.raises(ValueError, match="stitch_shards"):
+        BinaryHorizonPredictionDataset(tmp_path / "sharded.hdf5")
@@ -0,0 +1,98 @@
+import csv
+import math
+
+import h5py
+import numpy as np
+import torch
+from cae.utils.images import ImageType, create_dataset
+from cae.utils.sweep import (
+    _rebalance_threads,
+    _split_indices,
+    _should_stop,
+    grid,
+    load_shared_dataset,
+    run_sweep,
+)
+
+
+def test_grid_covers_every_combination():
+    configs = grid(["a.hdf5"], [1e-3, 1e-4], [0.5], [5, 20])
+    assert len(configs) == 4
+    assert {(c.learning_rate, c.horizon) for c in configs} == {
+        (1e-3, 5),
+        (1e-3, 20),
+        (1e-4, 5),
+        (1e-4, 20),
+    }
+
+
+def test_shared_dataset_holds_uint8_images(tmp_path, csv_files):
+    create_dataset(tmp_path / "dataset", csv_files, ImageType.D5, quiet=True)
+    dataset = load_shared_dataset(tmp_path / "dataset.hdf5")
+
+    assert dataset["images"].dtype == torch.uint8
+    assert dataset["images"].is_shared()
+    with h5py.File(tmp_path / "dataset.hdf5", "r") as dataset_file:
+        np.testing.assert_array_equal(
+            dataset["images"].numpy(), dataset_file["images"][:]
+        )
+
+
+def test_training_labels_never_reach_into_validation(tmp_path, csv_files):
+    create_dataset(tmp_path / "dataset", csv_files, ImageType.D5, quiet=True)
+    dataset = load_shared_dataset(tmp_path / "dataset.hdf5")
+
+    train_idxs, validation_idxs = _split_indices(dataset, 3, 0.3)
+    cutoff = np.sort(dataset["date"][validation_idxs])[0]
+    assert len(train_idxs) and len(validation_idxs)
+    assert (dataset["date"][train_idxs + 3] < cutoff).all()
+    # Only the rows in the gap are left out
+    labelled = len(train_idxs) + len(validation_idxs)
+    assert labelled == 3 * (15 - 3) - 3 * 3
+
+
+def test_median_stopping_rule():
+    scores = torch.tensor(
+        [
+            [0.9, 0.9],
+            [0.5, 0.4],
+            [0.6, 0.5],
+            [0.7, math.nan],
+        ]
+    )
+    # Still in the grace period
+    assert not _should_stop(scores, 0, 0, grace_epochs=1, min_trials=2)
+    assert _should_stop(scores, 0, 1, grace_epochs=1, min_trials=2)
+    assert not _should_stop(scores, 1, 1, grace_epochs=1, min_trials=2)
+    # Not enough other trials have reached the epoch yet
+    assert not _should_stop(scores, 0, 1, grace_epochs=1, min_trials=3)
+
+
+def test_threads_are_rebalanced_as_trials_finish():
+    thread_budget = torch.zeros(4, dtype=torch.int32)
+    _rebalance_threads(thread_budget, [0, 1, 2], cpus=8)
+    assert thread_budget.tolist() == [3, 3, 2, 0]
+
+    # Trial 1 finished and trial 3 is the last one left to start
+    _rebalance_threads(thread_budget, [0, 2, 3], cpus=8)
+    assert thread_budget[[0, 2, 3]].tolist() == [3, 3, 2]
+    _rebalance_threads(thread_budget, [3], cpus=8)
+    assert thread_budget[3] == 8
+    # Never drop below one thread
+    _rebalance_threads(thread_budget, [0, 1, 2, 3], cpus=2)
+    assert thread_budget.tolist() == [1, 1, 1, 1]
+
+
+def test_run_sweep_writes_results_table(tmp_path, csv_files):
+    create_dataset(tmp_path / "dataset", csv_files, ImageType.D5, quiet=True)
+    configs = grid([str(tmp_path / "dataset.hdf5")], [1e-3], [0.2, 0.5], [1])
+
+    results = run_sweep(
+        configs, tmp_path / "results.csv", epochs=2, batch_size=16, max_concurrent=2
+    )
+
+    assert [result.error for result in results] == ["", ""]
+    with open(tmp_path / "results.csv") as results_file:
+        rows = list(csv.DictReader(results_file))
+    assert [float(row["dropout"]) for row in rows] == [0.2, 0.5]
+    assert all(1 <= int(row["epochs_run"]) <= 2 for row in rows)